@@ -0,0 +1,348 @@
+import bz2
+import io
+import os
+import pickle as pkl
+import queue
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Settings
+'''
+
+# Number of threads used to compress/decompress the bz2 streams of a single file.
+# bz2 releases the GIL while it works, so these threads actually run in parallel.
+IO_WORKERS = min(8, os.cpu_count() or 1)
+
+# Maximum number of chunks/frames/files waiting in a queue at once. Keeps the memory bounded.
+QUEUE_DEPTH = 2 * IO_WORKERS
+
+# Number of uncompressed bytes that go into every independent bz2 stream of an output file
+STREAM_SIZE = 4 * 1024 * 1024
+
+# Every bz2 stream written with compression level 9 starts with these bytes (stream header + block magic)
+STREAM_MARKER = b'BZh91AY&SY'
+
+# Thread pool used to read whole files in the background
+_file_readers = ThreadPoolExecutor(max_workers = IO_WORKERS)
+
+'''
+Prefetching Functions
+'''
+
+def prefetch(func, items, depth = QUEUE_DEPTH, workers = 1):
+    '''
+    Apply a function to every item in the background and yield the results in order.
+
+    Inputs = func (function, applied to every item),
+             items (iterable, e.g. file names, frame indices or chunks of bytes),
+             depth (int, maximum number of results computed ahead of the consumer),
+             workers (int, number of background threads)
+    Outputs = generator that yields func(item) for every item, in the same order as the items
+
+    While the consumer works on one result, the next 'depth' results are already being
+    read/decompressed/computed by the background threads. Only 'depth' results are held in
+    memory at once, no matter how many items there are.
+    '''
+
+    depth = max(depth, workers)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        try:
+            for item in items:
+                pending.append(pool.submit(func, item))
+                # Wait for the oldest result once the queue is full
+                if len(pending) >= depth:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # The consumer stopped early, don't bother computing the rest
+            for future in pending:
+                future.cancel()
+
+def readPickleFileAsync(file):
+    '''
+    Start reading a compressed pickle file in the background.
+
+    Inputs = file (string, path of the .pbz2 file)
+    Outputs = future (concurrent.futures.Future, future.result() waits for and returns the data)
+
+    Start the reads as early as possible and only call .result() when the data is needed, so
+    the decompression overlaps with whatever the stage does in the meantime.
+    '''
+    return _file_readers.submit(readCompressedPickle, file)
+
+'''
+Parallel bz2 Functions
+'''
+
+class _StreamWriter:
+    '''
+    File-like object that cuts everything pickle writes to it into STREAM_SIZE chunks, compresses
+    every chunk as an independent bz2 stream in a thread pool and writes the streams to 'file' in order.
+
+    The concatenated streams are a regular (multi-stream) bz2 file that any bz2 reader can open.
+    '''
+
+    def __init__(self, file, pool, depth):
+        self.file = file
+        self.pool = pool
+        self.depth = depth
+        self.buffer = bytearray()
+        self.pending = deque()
+
+    def write(self, data):
+        size = memoryview(data).nbytes
+        self.buffer += data
+
+        # Send every full chunk to the thread pool
+        while len(self.buffer) >= STREAM_SIZE:
+            self._submit(bytes(self.buffer[:STREAM_SIZE]))
+            del self.buffer[:STREAM_SIZE]
+
+        return size
+
+    def _submit(self, chunk):
+        self.pending.append(self.pool.submit(bz2.compress, chunk, 9))
+
+        # Bound the number of chunks held in memory
+        while len(self.pending) > self.depth:
+            self.file.write(self.pending.popleft().result())
+
+    def close(self):
+        # Compress whatever is left and write all the remaining streams
+        if self.buffer:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.pending:
+            self.file.write(self.pending.popleft().result())
+
+class _StreamReader:
+    '''
+    File-like object that hands the decompressed chunks of a file to pickle in order.
+    '''
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b''
+        self.pos = 0
+
+    def _fill(self):
+        # Get the next chunk once the current one has been consumed
+        if self.pos >= len(self.buffer):
+            self.buffer = next(self.chunks, b'')
+            self.pos = 0
+        return len(self.buffer) - self.pos
+
+    def read(self, size = -1):
+        parts = []
+        while size != 0:
+            available = self._fill()
+            if not available:
+                break
+            n = available if size < 0 else min(size, available)
+            parts.append(self.buffer[self.pos:self.pos + n])
+            self.pos += n
+            if size > 0:
+                size -= n
+        return b''.join(parts)
+
+    def readline(self):
+        parts = []
+        while self._fill():
+            end = self.buffer.find(b'\n', self.pos)
+            if end != -1:
+                parts.append(self.buffer[self.pos:end + 1])
+                self.pos = end + 1
+                break
+            parts.append(self.buffer[self.pos:])
+            self.pos = len(self.buffer)
+        return b''.join(parts)
+
+class _SplitError(Exception):
+    '''
+    Raised when a file was split at a position that is not the start of a bz2 stream.
+    '''
+
+def _decompressStream(stream):
+    '''
+    Decompress a single, complete bz2 stream.
+    '''
+    decompressor = bz2.BZ2Decompressor()
+    try:
+        data = decompressor.decompress(stream)
+    except (OSError, ValueError) as e:
+        raise _SplitError() from e
+
+    if not decompressor.eof or decompressor.unused_data:
+        raise _SplitError()
+
+    return data
+
+def _streamOffsets(raw):
+    '''
+    Get the byte offsets at which the bz2 streams of a file start.
+    '''
+    offsets = []
+    start = raw.find(STREAM_MARKER)
+    while start != -1:
+        offsets.append(start)
+        start = raw.find(STREAM_MARKER, start + 1)
+    return offsets
+
+def readCompressedPickle(file, workers = IO_WORKERS):
+    '''
+    Decompress and read in a compressed pickle file.
+
+    Inputs = file (string, path of the .pbz2 file), workers (int, number of decompression threads)
+    Outputs = data (the unpickled object)
+
+    Files written by writeCompressedPickle are made of many independent bz2 streams, which are
+    decompressed in parallel and unpickled as they come in. Single stream files (like the ones
+    in the Results folder) are read sequentially.
+    '''
+
+    with open(file, 'rb') as f:
+        raw = f.read()
+
+    offsets = _streamOffsets(raw)
+
+    if workers > 1 and len(offsets) > 1 and offsets[0] == 0:
+        bounds = zip(offsets, offsets[1:] + [len(raw)])
+        chunks = prefetch(lambda bound: _decompressStream(raw[bound[0]:bound[1]]), bounds, workers = workers)
+        try:
+            return pkl.load(_StreamReader(chunks))
+        except _SplitError:
+            # The stream marker happened to show up inside the compressed data. Read it the slow way.
+            pass
+        finally:
+            chunks.close()
+
+    return pkl.load(bz2.BZ2File(io.BytesIO(raw), 'rb'))
+
+def writeCompressedPickle(data, file, workers = IO_WORKERS):
+    '''
+    Pickle and compress an object into a .pbz2 file using multiple threads.
+
+    Inputs = data (object to be pickled), file (string, path of the output file),
+             workers (int, number of compression threads)
+
+    The file is written under a temporary name and only renamed once it is complete, so a
+    job that is killed mid-write never leaves a truncated file behind.
+    '''
+
+    temp_file = file + '.tmp'
+    with open(temp_file, 'wb') as f, ThreadPoolExecutor(max_workers = workers) as pool:
+        writer = _StreamWriter(f, pool, depth = QUEUE_DEPTH)
+        pkl.dump(data, writer)
+        writer.close()
+    os.replace(temp_file, file)
+
+    return
+
+def _isMultiStream(raw):
+    '''
+    Check if the bytes of a .pbz2 file are made of more than one bz2 stream, i.e. if they can be decompressed in parallel.
+    '''
+    offsets = _streamOffsets(raw)
+    return len(offsets) > 1 and offsets[0] == 0
+
+def convertCompressedPickle(file, output_file = None, workers = IO_WORKERS):
+    '''
+    Rewrite a single stream .pbz2 file (e.g. the input files in Data_Files) as a multi-stream file
+    so that every read afterwards is decompressed in parallel.
+
+    Inputs = file (string, path of the .pbz2 file), output_file (string, path of the new file. None = replace the file),
+             workers (int, number of compression threads)
+    Output = converted (bool, False if the file was left as is because it is already multi-stream or fits in a single stream)
+
+    The pickled bytes are not changed, only the way they are compressed. The new file is still a regular bz2 file.
+    '''
+
+    output_file = output_file or file
+    with open(file, 'rb') as f:
+        raw = f.read()
+
+    pickled = None if _isMultiStream(raw) else bz2.decompress(raw)
+    if pickled is None or len(pickled) <= STREAM_SIZE:
+        if output_file != file:
+            shutil.copy(file, output_file)
+        return False
+
+    temp_file = output_file + '.tmp'
+    with open(temp_file, 'wb') as f, ThreadPoolExecutor(max_workers = workers) as pool:
+        writer = _StreamWriter(f, pool, depth = QUEUE_DEPTH)
+        for start in range(0, len(pickled), STREAM_SIZE):
+            writer.write(pickled[start:start + STREAM_SIZE])
+        writer.close()
+    os.replace(temp_file, output_file)
+
+    return True
+
+'''
+Write-Behind Functions
+'''
+
+class PickleWriter:
+    '''
+    Write-behind queue for output pickle files.
+
+    The data handed to write() is pickled and compressed by a background thread while the stage
+    keeps computing. At most 'depth' files wait in the queue, write() blocks once it is full.
+    Always use it as a context manager so every queued file is written before the stage ends:
+
+        with PickleWriter() as writer:
+            writer.write(data, 'Results/WASP189b_Final_Frames_v5')
+
+    The data must not be modified after it has been handed to write().
+
+    Used by the Checkpointer, whose files are written while the stage keeps working. The stage
+    outputs are written with outputPickleFile instead: they are the last thing every stage does
+    and the next stage starts by reading them, so there is nothing left to overlap the write with.
+    '''
+
+    def __init__(self, depth = 1):
+        self.queue = queue.Queue(maxsize = depth)
+        self.error = None
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            data, filename = item
+            # Stop writing after the first failure, the error is raised in the main thread
+            if self.error is None:
+                try:
+                    writeCompressedPickle(data, filename + '.pbz2')
+                except BaseException as e:
+                    self.error = e
+
+    def write(self, data, filename):
+        '''
+        Queue a file to be written. Same inputs as outputPickleFile.
+        '''
+        if self.error is not None:
+            raise self.error
+        self.queue.put((data, filename))
+
+    def close(self):
+        '''
+        Wait for every queued file to be written.
+        '''
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
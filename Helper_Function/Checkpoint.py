@@ -0,0 +1,133 @@
+import glob
+import os
+import time
+from Helper_Function.Async_IO import PickleWriter, readCompressedPickle
+
+'''
+Settings
+'''
+
+# Folder where the stages keep their checkpoint files
+CHECKPOINT_DIR = 'Results/Checkpoints'
+
+'''
+Checkpoint Functions
+'''
+
+def checkpointFile(name, part = None, directory = CHECKPOINT_DIR):
+    '''
+    Get the path (without the .pbz2 extension) of a checkpoint file.
+
+    Inputs = name (string, name of the checkpoint, usually the name of the stage output),
+             part (string, identifies the process writing the file e.g. 'rank3_of_96'. None = single file),
+             directory (string, folder of the checkpoint files)
+    Output = filename (string)
+    '''
+    os.makedirs(directory, exist_ok = True)
+
+    if part is None:
+        return os.path.join(directory, name)
+
+    return os.path.join(directory, f'{name}.{part}')
+
+def checkpointFiles(name, directory = CHECKPOINT_DIR):
+    '''
+    Get the paths of every checkpoint file written for a checkpoint name.
+    '''
+    files = glob.glob(os.path.join(directory, name + '.pbz2'))
+    files += glob.glob(os.path.join(directory, name + '.*.pbz2'))
+    return sorted(files)
+
+def loadCheckpoints(name, directory = CHECKPOINT_DIR):
+    '''
+    Read and merge every checkpoint file written for a checkpoint name.
+
+    Inputs = name (string, name of the checkpoint), directory (string, folder of the checkpoint files)
+    Output = results (dict, where each key identifies a finished item (e.g. a spectral pixel tag or
+             a frame index) and each value is the result of that item)
+
+    The files can come from runs with a different number of processes, every item is only
+    computed once so merging them is just a matter of joining the dictionaries.
+    '''
+    results = {}
+    for file in checkpointFiles(name, directory):
+        results.update(readCompressedPickle(file))
+    return results
+
+def clearCheckpoints(name, directory = CHECKPOINT_DIR):
+    '''
+    Delete every checkpoint file written for a checkpoint name.
+    '''
+    for file in checkpointFiles(name, directory):
+        os.remove(file)
+
+def startCheckpoints(name, directory = CHECKPOINT_DIR, resume = False, fresh_start = False):
+    '''
+    Get the results saved by previous runs, or start from scratch.
+
+    Inputs = name (string, name of the checkpoint), directory (string, folder of the checkpoint files),
+             resume (bool, True = load the checkpoints), fresh_start (bool, True = delete the checkpoints)
+    Output = results (dict, same as loadCheckpoints. Empty when starting from scratch)
+
+    Raises a RuntimeError if there are checkpoints but neither resume nor fresh_start is set, so
+    rerunning a killed job without --resume never throws its progress away by accident.
+    '''
+    if resume:
+        return loadCheckpoints(name, directory)
+
+    files = checkpointFiles(name, directory)
+    if files and not fresh_start:
+        raise RuntimeError(f'Found {len(files)} checkpoint file(s) of {name} in {directory} from an earlier run. '
+                           'Use --resume to continue it or --fresh-start to delete them and start over')
+
+    clearCheckpoints(name, directory)
+
+    return {}
+
+class Checkpointer:
+    '''
+    Periodically saves a dictionary of results while a stage fills it in.
+
+    The dictionary is saved every 'interval' seconds (when update() is called) and once more
+    when the checkpointer is closed. The files are compressed and written in the background
+    so the stage keeps computing in the meantime:
+
+        with Checkpointer(checkpointFile('WASP189b_Fixed_Frames_Fits_v5'), results) as checkpointer:
+            for id in frames_to_do:
+                results[id] = fitFrame(id)
+                checkpointer.update()
+    '''
+
+    def __init__(self, filename, results, interval = 600):
+        self.filename = filename
+        self.results = results
+        self.interval = interval
+        self.last_save = time.time()
+        self.writer = PickleWriter()
+
+    def save(self):
+        '''
+        Queue a copy of the results to be written to the checkpoint file.
+        '''
+        self.writer.write(dict(self.results), self.filename)
+        self.last_save = time.time()
+
+    def update(self):
+        '''
+        Save the results if the last save was more than 'interval' seconds ago.
+        '''
+        if time.time() - self.last_save >= self.interval:
+            self.save()
+
+    def close(self):
+        '''
+        Save the results one last time and wait for the files to be written.
+        '''
+        self.save()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
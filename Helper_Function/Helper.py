@@ -1,8 +1,6 @@
 import numpy as np 
-import pickle as pkl
-import matplotlib.pyplot as plt
 import csv
-import bz2
+from Helper_Function.Async_IO import readCompressedPickle, writeCompressedPickle
 
 '''
 Functions That Help Visualize Things
@@ -14,6 +12,8 @@ def plot(frame, title = '', vmin = 0, vmax = 200):
 
     Inputs = frame (array [m x n]), title (string), vmin (int), vmax (int)
     '''
+    import matplotlib.pyplot as plt # Only imported when plotting
+
     plt.figure() # Create figure 
     plt.title(title) # Set title
     plt.imshow(frame, vmin = vmin, vmax = vmax, origin = 'lower', aspect = 'auto', interpolation = None) # Plot image
@@ -88,12 +88,12 @@ def getTags(csv_file):
 
 def readPickleFile(file):
     '''
-    Decompress and read in a compressed pickle file.
+    Decompress and read in a compressed pickle file. The bz2 streams of the file
+    are decompressed in parallel when the file was written by outputPickleFile.
     '''
 
     # Decompress and load data
-    data = bz2.BZ2File(file, 'rb')
-    data = pkl.load(data)
+    data = readCompressedPickle(file)
 
     return data
 
@@ -101,10 +101,10 @@ def outputPickleFile(data, filename):
     '''
     Output a compressed pickle file. This will take a while to compress, but the 
     file size is much smaller when compared to the regular, uncompressed pickle file.
+    The data is compressed in chunks by multiple threads to speed this up.
     '''
     # Compress and write file
-    with bz2.BZ2File(filename + '.pbz2', 'w') as f: 
-        pkl.dump(data, f)
+    writeCompressedPickle(data, filename + '.pbz2')
 
     return
 
@@ -161,6 +161,50 @@ def decoder(tag, x_length):
     y = int((tag - x) / x_length)
     return x, y
 
+def buildColumnIndex(tags, x_length):
+    '''
+    Build a spatial index over pixel tags so that the pixels near a given position
+    can be found without going through every single pixel.
+
+    Inputs = tags (array [1 x n], where each index is a pixel tag), x_length (int, x axis length of the frame)
+    Output = index (dict) -> 'Order' (array [1 x n], indices into 'tags' sorted by column),
+                             'X' (array [1 x n], x index of every pixel in that order),
+                             'Y' (array [1 x n], y index of every pixel in that order)
+    '''
+
+    # Decode all the tags at once
+    tags = np.asarray(tags)
+    x = tags % x_length
+    y = tags // x_length
+
+    # Sort the pixels by column so a window of columns is a single slice
+    order = np.argsort(x, kind = 'stable')
+    index = {'Order': order, 'X': x[order], 'Y': y[order]}
+
+    return index
+
+def nearbyPixels(index, x, y, column_window, row_radius = None):
+    '''
+    Get the pixels of a column index that are close to a given position.
+
+    Inputs = index (dict, output of buildColumnIndex), x (int, x index of the position), y (int, y index of the position),
+             column_window (int, maximum number of columns between the pixels and the position),
+             row_radius (int, maximum number of rows between the pixels and the position. None = any row)
+    Output = idxs (array, indices into the tags used to build the index, in increasing order)
+    '''
+
+    # Find the slice of pixels that fall inside the column window
+    lo = np.searchsorted(index['X'], x - column_window, side = 'left')
+    hi = np.searchsorted(index['X'], x + column_window, side = 'right')
+    idxs = index['Order'][lo:hi]
+
+    # Only keep the ones that are also close enough in the y direction
+    if row_radius is not None:
+        idxs = idxs[np.abs(index['Y'][lo:hi] - y) <= row_radius]
+
+    # Keep the original order of the tags so ties are broken the same way as in the exhaustive search
+    return np.sort(idxs)
+
 def getNspecAndSpecDkVals(dk_frames, spec_tags, nspec_tags, outliers = 1, mult = 3):
     '''
     This function generates the pixel value arrays that will be used in the 
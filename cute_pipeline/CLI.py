@@ -0,0 +1,201 @@
+import argparse
+import importlib
+import json
+import os
+import shlex
+import sys
+import time
+import traceback
+from cute_pipeline.Config import DEFAULTS, loadConfig, filePaths
+from cute_pipeline.Parallel import getComm
+
+'''
+Settings
+'''
+
+# Module of every stage and whether it runs on every MPI process or only on the root process.
+# The modules are only imported when their stage runs, so e.g. stage1 never imports scipy.
+STAGES = {
+    'stage1': ('cute_pipeline.Proxy_Matches', True),
+    'stage2': ('cute_pipeline.Frame_Creations', True),
+    'stage3': ('cute_pipeline.Median_Frame_Fitting', False),
+    'stage4': ('cute_pipeline.Fixed_Frame_Fitting', False),
+    'stage5': ('cute_pipeline.Create_Final_Frames', False),
+}
+
+'''
+Command Line Functions
+'''
+
+def buildParser():
+    '''
+    Build the parser of the cute-pipeline command.
+    '''
+
+    # Settings shared by every command. They default to None so that only the options given in the command line override the config file.
+    # The switches have a --no- form to turn off a setting that the config file turns on.
+    settings = argparse.ArgumentParser(add_help = False)
+    settings.add_argument('--config', help = 'JSON file with the settings of the run (only read by the root process)')
+    settings.add_argument('--target', help = 'name of the observed target, e.g. WASP189b')
+    settings.add_argument('--visit', type = int, help = 'visit to process')
+    settings.add_argument('--data-dir', help = 'folder with the input data files')
+    settings.add_argument('--results-dir', help = 'folder where the stage outputs are written')
+    settings.add_argument('--frames', type = int, nargs = 2, metavar = ('FIRST', 'STOP'), help = 'indices of the visit in the Science Frames (default: found from the frame IDs)')
+    settings.add_argument('--seed', type = int, help = 'seed of the random search in the gaussian fits')
+    settings.add_argument('--approximate', action = 'store_const', const = True, help = 'stage1: only search for proxies around every spectral pixel')
+    settings.add_argument('--no-approximate', action = 'store_const', const = False, dest = 'approximate', help = 'stage1: search every non-spectral pixel (the default, overrides the config file)')
+    settings.add_argument('--column-window', type = int, help = 'stage1: columns searched on each side of a spectral pixel in approximate mode')
+    settings.add_argument('--row-radius', type = int, help = 'stage1: rows searched on each side of a spectral pixel in approximate mode (default: every row)')
+    settings.add_argument('--validation-step', type = int, help = 'stage1: check every n-th approximate match against the exhaustive search')
+    settings.add_argument('--resume', action = 'store_const', const = True, help = 'stage1/stage4: skip the work saved in the checkpoints')
+    settings.add_argument('--no-resume', action = 'store_const', const = False, dest = 'resume', help = 'stage1/stage4: don\'t load the checkpoints (the default, overrides the config file)')
+    settings.add_argument('--fresh-start', action = 'store_const', const = True, help = 'stage1/stage4: delete the checkpoints of an earlier run and start over')
+    settings.add_argument('--no-fresh-start', action = 'store_const', const = False, dest = 'fresh_start', help = 'stage1/stage4: refuse to delete the checkpoints (the default, overrides the config file)')
+    settings.add_argument('--merge-partial', action = 'store_const', const = True, help = 'stage1/stage4: only merge the checkpoints into the normal output')
+    settings.add_argument('--no-merge-partial', action = 'store_const', const = False, dest = 'merge_partial', help = 'stage1/stage4: run the stage normally (the default, overrides the config file)')
+    settings.add_argument('--checkpoint-interval', type = float, help = 'stage1/stage4: seconds between checkpoints')
+
+    parser = argparse.ArgumentParser(prog = 'cute-pipeline', description = 'CUTE CubeSat Proxy Pixel Pipeline')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    run = commands.add_parser('run', parents = [settings], help = 'run one or more stages of the pipeline')
+    run.add_argument('stages', nargs = '+', choices = list(STAGES) + ['all'], help = 'stages to run, in order (all = stage1 to stage5)')
+
+    regress = commands.add_parser('regress', parents = [settings], help = 'compare the stage outputs and performance against golden files')
+    # The default must be a single choice, argparse checks it against the choices when no stage is given
+    regress.add_argument('stages', nargs = '*', choices = list(STAGES) + ['all'], default = 'all', help = 'stages to check (default: all)')
+    regress.add_argument('--golden-dir', help = 'folder with the golden outputs (default: Results. On a fixture, the golden files blessed in its Golden folder come first)')
+    regress.add_argument('--budgets', help = 'JSON file with the per-stage budgets and the tolerances, '
+                                             'e.g. {"budgets": {"stage1": {"seconds": 600, "memory_mb": 4000}}, "tolerances": {"fit_rtol": 1e-3}} '
+                                             '(default: budgets.json in the current folder, if there is one)')
+    regress.add_argument('--no-budgets', action = 'store_true', help = 'don\'t check any budget')
+    regress.add_argument('--bless', action = 'store_true', help = 'replace the golden files with the new outputs (on a fixture, the files in its Golden folder. '
+                                                                  'On the full data only with --golden-dir)')
+    regress.add_argument('--mpi-launcher', help = 'run stage1 and stage2 with MPI to time them, e.g. "mpiexec -n 96" (default: a single process)')
+
+    fixture = commands.add_parser('fixture', parents = [settings], help = 'create a small copy of the input data for regression checks')
+    fixture.add_argument('fixture_dir', help = 'folder of the fixture, used as --data-dir of cute-pipeline regress')
+    fixture.add_argument('--columns', type = int, default = 200, help = 'keep the spectral pixels of the first COLUMNS columns (default: 200)')
+
+    convert = commands.add_parser('convert', parents = [settings], help = 'rewrite .pbz2 files as multi-stream files that are decompressed in parallel')
+    convert.add_argument('files', nargs = '*', help = 'files to convert in place (default: the Dark Pixel Values, Science Frames and Visit Pixel Values of the data folder)')
+
+    render = commands.add_parser('render', parents = [settings], help = 'render diagnostic images and animations of the stage outputs')
+    render.add_argument('kind', choices = ['median-fits', 'fixed-fits', 'frames'],
+                        help = 'median-fits = stage 3 fit of every bin, fixed-fits = stage 4 fit of every bin of every frame, '
+                               'frames = background, fixed and final frame of every frame')
+    render.add_argument('--frame', type = int, nargs = '+', dest = 'frame_ids', help = 'only render these frames of the visit (fixed-fits and frames)')
+    render.add_argument('--output-dir', default = 'Images/Render', help = 'folder of the images and the animation (default: Images/Render)')
+    render.add_argument('--animation', choices = ['gif', 'mp4', 'none'], default = 'gif', help = 'format of the animation (default: gif)')
+    render.add_argument('--fps', type = float, default = 5, help = 'frames per second of the animation (default: 5)')
+    render.add_argument('--workers', type = int, help = 'number of rendering processes (default: one per CPU)')
+
+    return parser
+
+def runStages(stages, config_file = None, overrides = None):
+    '''
+    Run stages of the pipeline one after the other.
+
+    Inputs = stages (array, names of the stages e.g. ['stage1', 'stage2']),
+             config_file (string, JSON config file. None = defaults), overrides (dict, settings that take priority over the file)
+
+    Only the root process reads the config, every other process gets it from a broadcast. The sequential
+    stages only run on the root process, the other processes wait for them at a barrier.
+
+    If a sequential stage fails, the root process tells the other processes so every one of them stops with
+    an error instead of waiting forever. If a parallel stage fails on any process of an MPI run, the whole run
+    is aborted, since the other processes may be waiting for it in the middle of the stage.
+    '''
+
+    # MPI is only initialized if one of the stages needs it
+    comm = getComm(parallel = any(STAGES[stage][1] for stage in stages))
+    rank = comm.Get_rank()
+
+    config = loadConfig(config_file, overrides) if rank == 0 else None
+    config = comm.bcast(config, root = 0)
+
+    for stage in stages:
+        module_name, parallel = STAGES[stage]
+        start = time.perf_counter()
+
+        try:
+            if parallel:
+                importlib.import_module(module_name).run(config, comm)
+            elif rank == 0:
+                importlib.import_module(module_name).run(config)
+        except BaseException:
+            if parallel and comm.Get_size() > 1:
+                traceback.print_exc()
+                sys.stderr.flush()
+                comm.Abort(1)
+            elif not parallel:
+                comm.bcast(f'{stage} failed on the root process', root = 0)
+            raise
+
+        # The other processes find out if the sequential stage failed on the root process
+        if not parallel:
+            error = comm.bcast(None, root = 0)
+            if error is not None:
+                raise RuntimeError(error)
+
+        if rank == 0:
+            print(f'{stage} done in {time.perf_counter() - start:.1f} s', flush = True)
+
+        comm.Barrier()
+
+def main(argv = None):
+    '''
+    Entry point of the cute-pipeline command.
+
+    Input = argv (array, command line arguments. None = sys.argv[1:])
+    '''
+
+    args = buildParser().parse_args(argv)
+    stages = getattr(args, 'stages', None)
+    stages = list(STAGES) if not stages or 'all' in stages else stages
+    overrides = {key: val for key, val in vars(args).items() if key in DEFAULTS}
+
+    if args.command == 'run':
+        runStages(stages, args.config, overrides)
+
+    elif args.command == 'regress':
+        from cute_pipeline.Regression import runRegression, printReport, BUDGETS_FILE
+
+        # Use the default budgets file unless another one is given
+        budgets_file = args.budgets
+        if budgets_file is None and os.path.exists(BUDGETS_FILE):
+            budgets_file = BUDGETS_FILE
+
+        limits = {}
+        if budgets_file is not None and not args.no_budgets:
+            with open(budgets_file, mode='r') as f:
+                limits = json.load(f)
+
+        launcher = shlex.split(args.mpi_launcher) if args.mpi_launcher else None
+        report = runRegression(stages, loadConfig(args.config, overrides), args.golden_dir,
+                               limits.get('budgets'), limits.get('tolerances'), args.bless, launcher)
+        if not printReport(report):
+            sys.exit(1)
+
+    elif args.command == 'fixture':
+        from cute_pipeline.Regression import makeFixture
+
+        makeFixture(loadConfig(args.config, overrides), args.fixture_dir, args.columns)
+
+    elif args.command == 'convert':
+        from Helper_Function.Async_IO import convertCompressedPickle
+
+        config = loadConfig(args.config, overrides)
+        paths = filePaths(config)
+        for file in args.files or [paths['Dark Pixel Values'], paths['Science Frames'], paths['Visit Pixel Values']]:
+            start = time.perf_counter()
+            converted = convertCompressedPickle(file)
+            print(f'{file}: ' + (f'converted in {time.perf_counter() - start:.1f} s' if converted else 'left as is (already multi-stream or a single stream is enough)'), flush = True)
+
+    elif args.command == 'render':
+        from cute_pipeline.Render import render
+
+        start = time.perf_counter()
+        animation = None if args.animation == 'none' else args.animation
+        files = render(args.kind, loadConfig(args.config, overrides), args.output_dir, args.frame_ids, animation, args.fps, args.workers)
+        print(f'{len(files)} images rendered in {time.perf_counter() - start:.1f} s', flush = True)
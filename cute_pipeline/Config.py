@@ -0,0 +1,124 @@
+import json
+import os
+import numpy as np
+
+'''
+Settings
+'''
+
+# Default settings of a pipeline run. Every one of them can be changed in a JSON config file
+# (e.g. {"target": "WASP189b", "visit": 5, "approximate": true}) or from the command line.
+DEFAULTS = {
+    'target': 'WASP189b',
+    'visit': 5,
+    'data_dir': 'Data_Files',
+    'results_dir': 'Results',
+    'x_length': 2048, # Number of pixels in the x-axis of the frames
+    'bin_columns': 25, # Number of columns per bin in the gaussian fits
+    'seed': None, # Seed of the random search in the gaussian fits. None = different every run
+    'frames': None, # [first, last + 1] indices of the visit in the Science Frames. None = use VISIT_FRAME_IDS
+
+    # Approximate proxy pixel search (stage 1)
+    'approximate': False,
+    'column_window': 50,
+    'row_radius': None,
+    'validation_step': 100,
+
+    # Checkpoint/restart (stages 1 and 4)
+    'resume': False,
+    'fresh_start': False, # Delete the checkpoints of an earlier run instead of refusing to start
+    'merge_partial': False,
+    'checkpoint_interval': 600,
+}
+
+# Frame IDs of the first and last Science Frame of every visit
+VISIT_FRAME_IDS = {
+    'WASP189b': {1: (358, 408), 2: (409, 462), 3: (467, 529), 4: (530, 608), 5: (609, 699),
+                 6: (700, 838), 7: (839, 979), 8: (1083, 1225), 9: (1227, 1399)},
+}
+
+'''
+Config Functions
+'''
+
+def loadConfig(file = None, overrides = None):
+    '''
+    Build the settings of a pipeline run.
+
+    Inputs = file (string, path of a JSON config file. None = only use the defaults),
+             overrides (dict, settings that take priority over the file e.g. the command line options. None values are ignored)
+    Output = config (dict, every key of DEFAULTS with its value for this run)
+    '''
+
+    config = dict(DEFAULTS)
+
+    # Read the config file
+    if file is not None:
+        with open(file, mode='r') as f:
+            settings = json.load(f)
+
+        unknown = set(settings) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f'Unknown settings in {file}: {", ".join(sorted(unknown))}')
+
+        config.update(settings)
+
+    # Apply the overrides
+    if overrides is not None:
+        config.update({key: val for key, val in overrides.items() if val is not None})
+
+    return config
+
+def filePaths(config):
+    '''
+    Get the paths of every file read or written by the pipeline for the target and visit of a run.
+
+    Input = config (dict, output of loadConfig)
+    Output = paths (dict). The stage outputs don't have the .pbz2 extension (same as outputPickleFile).
+    '''
+
+    target, visit = config['target'], config['visit']
+    data_dir, results_dir = config['data_dir'], config['results_dir']
+
+    # The quick-look proxy matches are kept apart from the full ones
+    matches = f'{target}_Median_Method_Proxy_Matches' + ('_Approximate' if config['approximate'] else '')
+
+    paths = {'Spectral Tags': os.path.join(data_dir, 'spec_tags.csv'),
+             'Non-Spectral Tags': os.path.join(data_dir, 'nspec_tags.csv'),
+             'Excluded Tags': os.path.join(data_dir, 'exclude_tags.csv'),
+             'Dark Pixel Values': os.path.join(data_dir, f'{target}_Nspec_and_Spec_Vals_Dk_Frames.pbz2'),
+             'Science Frames': os.path.join(data_dir, f'{target}_Sc_Frames.pbz2'),
+             'Visit Pixel Values': os.path.join(data_dir, f'{target}_Nspec_Spec_Data_v{visit}.pbz2'),
+             'Proxy Matches': os.path.join(results_dir, matches),
+             'Fixed Frames Pre Infill': os.path.join(results_dir, f'{target}_Fixed_Frames_Pre_Infill_v{visit}'),
+             'Median Fits': os.path.join(results_dir, f'{target}_Median_Fits_v{visit}'),
+             'Fixed Frames Fits': os.path.join(results_dir, f'{target}_Fixed_Frames_Fits_v{visit}'),
+             'Final Frames': os.path.join(results_dir, f'{target}_Final_Frames_v{visit}'),
+             'Checkpoints': os.path.join(results_dir, 'Checkpoints')}
+
+    return paths
+
+def visitFrames(config, frame_ids):
+    '''
+    Get the indices of the Science Frames that belong to the visit of a run.
+
+    Inputs = config (dict, output of loadConfig), frame_ids (array [1 x n], frame ID of every Science Frame)
+    Output = frames (slice, indices of the visit's frames)
+    '''
+
+    # Use the indices given in the config if there are any
+    if config['frames'] is not None:
+        first, last = config['frames']
+        return slice(first, last)
+
+    target, visit = config['target'], config['visit']
+    if visit not in VISIT_FRAME_IDS.get(target, {}):
+        raise ValueError(f'Unknown frame IDs for visit {visit} of {target}, set the "frames" setting instead')
+
+    # Find the frames whose ID falls inside the visit
+    first_id, last_id = VISIT_FRAME_IDS[target][visit]
+    idxs = np.flatnonzero((np.asarray(frame_ids) >= first_id) & (np.asarray(frame_ids) <= last_id))
+    if not len(idxs):
+        raise ValueError(f'None of the Science Frames belong to visit {visit} of {target}')
+
+    return slice(int(idxs[0]), int(idxs[-1]) + 1)
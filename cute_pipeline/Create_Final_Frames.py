@@ -0,0 +1,81 @@
+import numpy as np
+from Helper_Function.Helper import outputPickleFile
+from Helper_Function.Async_IO import readPickleFileAsync, prefetch
+from cute_pipeline.Config import filePaths
+
+def infillFrame(frame, frame_fits, x = 25):
+    '''
+    Infill a single frame based on the fixed frame fits
+
+    Inputs = frame (array [n x m], the frame to be infilled),
+             frame_fits (array [1 x n], where n is the number of bins),
+             x (int, number of columns per bin)
+             
+    Ouputs = frame (array [n x m], the input frame after infill)
+
+    The frame will be infilled is the value of the pixel is nan or 
+    if the value is less than zero (due to an oversubtraction).
+    '''
+
+    # Find every pixel that needs to be infilled
+    row_idxs, col_idxs = np.nonzero(np.isnan(frame) | (frame < 0))
+    fit_idxs = col_idxs // x  # Determine the fit column index of every pixel
+
+    # Replace the pixels of every bin at once with the corresponding fit
+    for fit_idx in np.unique(fit_idxs):
+        in_bin = fit_idxs == fit_idx
+        fit = frame_fits[fit_idx][0]  # Access the corresponding fit
+        frame[row_idxs[in_bin], col_idxs[in_bin]] = np.abs(fit[row_idxs[in_bin]])  # Replace the original values
+
+    return frame
+
+def removeCosmicRays(frame):
+    '''
+    Remove the cosmic rays from a single infilled frame using lacosmic.
+
+    Inputs = frame (array [n x m], output of infillFrame)
+    Outputs = cr_removed_frame (array [n x m], the frame without cosmic rays), mask (array [n x m], True where there was a cosmic ray)
+
+    'Neighbor threshold' and 'cr threshold' are the modifiable parameters, the others are inherent to the CCD
+    '''
+    import lacosmic # Only imported when removing cosmic rays
+
+    return lacosmic.lacosmic(data=frame, contrast=2, cr_threshold=6, neighbor_threshold=4, effective_gain=1.5, readnoise=4.5)
+
+def run(config):
+    '''
+    Infill the fixed frames of a visit and remove their cosmic rays (stage 5).
+
+    Inputs = config (dict, output of loadConfig)
+    Output = cr_removed_frames (array, the final frames. None for the frames that stage 4 didn't fit)
+    '''
+
+    paths = filePaths(config)
+
+    # Decompress both pickle files at the same time
+    frames_data = readPickleFileAsync(paths['Fixed Frames Pre Infill'] + '.pbz2')
+    fits_data = readPickleFileAsync(paths['Fixed Frames Fits'] + '.pbz2')
+
+    # Get the fixed science-minus-recreated-background frames from the pickle file
+    fixed_frames = frames_data.result()['Fixed Frames']
+
+    # Get the fixed frame fits from the pickle file
+    fits = fits_data.result()['Fits']
+
+    # Frames without fits (stage 4 run with merge_partial) can't be infilled, they are None in the final frames
+    fitted_ids = [id for id in range(len(fixed_frames)) if fits[id] is not None]
+    if len(fitted_ids) < len(fixed_frames):
+        print(f'{len(fixed_frames) - len(fitted_ids)} of {len(fixed_frames)} frames have no fits and are left out of the Final Frames')
+
+    # Infill the images in the background so the next frame is ready as soon as lacosmic is done with the current one.
+    # The infill is vectorised, so it only holds the GIL for a few milliseconds per frame.
+    final_frames_infilled = prefetch(lambda id: infillFrame(fixed_frames[id].copy(), fits[id], config['bin_columns']), fitted_ids)
+
+    # Remove cosmic rays from final frames using lacosmic
+    cr_removed = {id: removeCosmicRays(frame)[0] for id, frame in zip(fitted_ids, final_frames_infilled)}
+    cr_removed_frames = tuple(cr_removed.get(id) for id in range(len(fixed_frames)))
+
+    # Save the final frames
+    outputPickleFile(cr_removed_frames, paths['Final Frames'])
+
+    return cr_removed_frames
@@ -0,0 +1,162 @@
+import os
+import numpy as np
+from Helper_Function.Helper import doubleGaussCurve, filterArray, outputPickleFile
+from Helper_Function.Async_IO import readPickleFileAsync, prefetch
+from Helper_Function.Checkpoint import Checkpointer, checkpointFile, startCheckpoints, clearCheckpoints
+from cute_pipeline.Median_Frame_Fitting import binMedians
+from cute_pipeline.Config import filePaths
+
+def random_params_within_bounds(lower_bound, upper_bound):
+    '''Generate random parameters within the given bounds.'''
+
+    return np.random.uniform(lower_bound + 0.0000001, upper_bound - 0.0000001)
+
+def filterAndFitToCurve(x_data, median, big_params, n):
+    '''
+    Filter the median data, calculate initial parameters and bounds, and find the best fit.
+    '''
+    from scipy.optimize import curve_fit # Only imported when fitting
+
+    # Filter the median array
+    col = filterArray(arr = median, hi = 200, lo =-20 )
+    indices = np.isfinite(col)
+
+    # Recreate the arrays based only where the filtered array value is finite 
+    x_data_int, col_int = x_data[indices], col[indices]
+
+    # Use the ratio to give the 'best' initial parameter guess
+    ratio = big_params[0] / big_params[4]
+    
+    # Define the intial parameter guess and bounds
+    g2_p0 = [big_params[0], big_params[1], big_params[2], big_params[3],
+             big_params[0] / ratio, big_params[5], big_params[6], big_params[7]]
+    adjustment = np.array([60] + [0.000001] * 7)
+
+    # Allow for both peaks to fluctuate
+    g2_lbound = np.array(g2_p0) - adjustment
+    g2_ubound = np.array(g2_p0) + adjustment
+
+    # Run a random search method to find the best fit coefficients
+    best_resid, good_fit, good_params = 10000000, np.array([]), None
+    for _ in range(n):
+        # Generate the 'random' initial parameters  
+        random_p0 = random_params_within_bounds(g2_lbound, g2_ubound)
+
+        # Get the fit coefficients
+        popt, _ = curve_fit(doubleGaussCurve, x_data_int, col_int, p0=random_p0, bounds=(g2_lbound, g2_ubound), maxfev=100000)
+
+        # Perform a reality check on the coefficients. If they make sense, continue, else, don't bother.
+        if popt[5] < popt[1] + 12:
+
+            # Create a fit with the coefficients
+            y_fit = doubleGaussCurve(x_data, *popt)
+
+            # Get the residuals between the fit and the data
+            resids = np.nansum(np.abs(y_fit - col))
+
+            # If the new residual is better than the best one, the new residual is the new best one
+            if resids < best_resid:
+
+                # Save the fit data if the residual is the best one so far
+                best_resid, good_fit, good_params = resids, y_fit, popt
+
+    return good_fit, good_params, col
+
+def fitFrame(frame, params, x, n, medians = None):
+    '''
+    Fit a double gaussian to every bin of columns of a single fixed frame.
+
+    Inputs = frame (array [m x n]), params (array, median frame fit parameters of every bin),
+             x (int, number of columns per bin), n (int, number of random search runs per bin),
+             medians (array, output of binMedians(frame, x) if it was already computed)
+    Output = new_fits (array, where each index is the output of filterAndFitToCurve for a bin)
+    '''
+
+    # Get the medians of each bin at every row to create a master pix. distribution graph
+    if medians is None:
+        medians = binMedians(frame, x)
+
+    # Perform a random search to find the best fit coefficients for each median trace curve 'n' times
+    x_data = np.arange(len(frame))
+    new_fits = []
+
+    for i, median in enumerate(medians):
+        # Perform and save the best fit
+        fit_result = filterAndFitToCurve(x_data, median, params[i], n)
+        new_fits.append(fit_result)
+
+    return new_fits
+
+def run(config, n = 20):
+    '''
+    Fit a double gaussian to every bin of columns of every fixed frame of a visit (stage 4).
+
+    Inputs = config (dict, output of loadConfig), n (int, number of random search runs per bin)
+    Output = data (dict, contents of the output file)
+
+    Settings used: 'resume', 'fresh_start', 'merge_partial', 'checkpoint_interval' (checkpoint/restart).
+    With 'merge_partial', the frames that haven't been fitted yet are None in 'Fits'.
+    '''
+
+    paths = filePaths(config)
+    x = config['bin_columns']
+    merge_partial = config['merge_partial']
+
+    # Name of the output file (and of the checkpoint file)
+    output_name = os.path.basename(paths['Fixed Frames Fits'])
+    checkpoint_dir = paths['Checkpoints']
+
+    # Get the fits of the frames that were fitted by previous runs, or start from scratch
+    done = startCheckpoints(output_name, checkpoint_dir, config['resume'] or merge_partial, config['fresh_start'])
+
+    # Decompress both pickle files at the same time
+    frames_data = readPickleFileAsync(paths['Fixed Frames Pre Infill'] + '.pbz2')
+    fits_data = readPickleFileAsync(paths['Median Fits'] + '.pbz2')
+
+    # Get the fixed science-minus-recreated-background frames from the pickle file
+    frames = frames_data.result()['Fixed Frames']
+
+    # Get the best fit parameters for the median frame from the best fit pickle file
+    params = fits_data.result()['Params']
+
+    # Compute the bin medians of the next frame in the background while the current one is fitted
+    todo = [] if merge_partial else [id for id in range(len(frames)) if id not in done]
+    medians = prefetch(lambda id: binMedians(frames[id], x), todo, depth = 1)
+
+    # Get a multiple fits for each frame
+    fits = []
+
+    # The last checkpoint is saved when the loop ends, also if it stops with an error
+    with Checkpointer(checkpointFile(output_name, directory = checkpoint_dir), done, config['checkpoint_interval']) as checkpointer:
+        for id, frame in enumerate(frames):
+
+            # Skip the frames that were fitted before the restart
+            if id in done:
+                fits.append(done[id])
+                continue
+            elif merge_partial:
+                fits.append(None)
+                continue
+
+            # Use the same random search every run if there is a seed. Every frame gets its own seed,
+            # so a resumed run fits the remaining frames the same way as a run that was never stopped.
+            if config['seed'] is not None:
+                np.random.seed(config['seed'] + id)
+
+            new_fits = fitFrame(frame, params, x, n, next(medians))
+            fits.append(new_fits)
+
+            # Save the progress every once in a while
+            done[id] = new_fits
+            checkpointer.update()
+
+    data = {'Info': f'Fits and parameters of fits for each median curve trace across the rows of the fixed frames with {x} columns per bin for visit {config["visit"]} of {config["target"]}.',
+            'Fits': fits}
+
+    outputPickleFile(data = data, filename = paths['Fixed Frames Fits'])
+
+    # The checkpoint is not needed anymore once the full results are out
+    if not merge_partial:
+        clearCheckpoints(output_name, checkpoint_dir)
+
+    return data
@@ -0,0 +1,173 @@
+import numpy as np
+from Helper_Function.Helper import getTags, decoder, outputPickleFile
+from Helper_Function.Async_IO import readPickleFileAsync
+from cute_pipeline.Config import filePaths, visitFrames
+from cute_pipeline.Parallel import getComm
+from cute_pipeline.Proxy_Matches import getMatches
+
+def orderProxyMatches(proxy_matches_data, exclude_tags):
+    '''
+    Create individual lists of the spectral and non-spectral tags of the proxy pixel matches
+    for easier access. Also, filter out hot pixels.
+
+    Inputs = proxy_matches_data (contents of the stage 1 output file, see getMatches),
+             exclude_tags (array [1 x n], tags of the hot pixels)
+    Outputs = spec_tags_ordered_list (array, spectral tag of every match), nspec_tags_ordered_list (array, non-spectral tag of every match)
+    '''
+
+    spec_tags_ordered_list = []
+    nspec_tags_ordered_list = []
+
+    # For every node used in the previous part (however many there were)
+    for node_matches in getMatches(proxy_matches_data):
+        for match in node_matches:
+            # Grab the spectral and non-spectral pixel tags from every proxy pixel match in the dictionary
+            spec_tag = match['Combo'][0]
+            nspec_tag = match['Combo'][1]
+            # Filter out hot pixels
+            if spec_tag not in exclude_tags and nspec_tag not in exclude_tags:
+                spec_tags_ordered_list.append(spec_tag)
+                nspec_tags_ordered_list.append(nspec_tag)
+
+    return spec_tags_ordered_list, nspec_tags_ordered_list
+
+def createBackgroundImage(i, nspec_tags, nspec_tag_to_index, spec_tags_ordered_list, nspec_tags_ordered_list, visit_nspec_vals_sc, x_length = 2048):
+    '''
+    Create the background image of a single science frame based on the proxy pixel matches.
+
+    Inputs = i (int, index of the frame in the visit), nspec_tags (array, tags of all the non-spectral pixels),
+             nspec_tag_to_index (dict, index of every non-spectral tag in nspec_tags),
+             spec_tags_ordered_list, nspec_tags_ordered_list (arrays, output of orderProxyMatches),
+             visit_nspec_vals_sc (array, where each index is the value of a non-spectral pixel in every science frame of the visit),
+             x_length (int, x axis length of the frame)
+    Output = bck_im (array [100 x x_length], the background image)
+    '''
+
+    # Create an empty image for each science frame
+    bck_im = np.full((100, x_length), np.nan)
+
+    # Fill in all non spectral pixels
+    non_spec_coords = [decoder(tag, x_length) for tag in nspec_tags]
+    x_coords, y_coords = zip(*non_spec_coords)
+    bck_im[y_coords, x_coords] = 0 # Set them to 0
+
+    # Fill in all spectral pixels with their proxy matches
+    for j, (nspec_tag, spec_tag) in enumerate(zip(nspec_tags_ordered_list, spec_tags_ordered_list)):
+
+        # Check if the nspec_tag is valid and continue if not
+        if nspec_tag not in nspec_tag_to_index:
+            continue
+
+        nspec_tag_ind = nspec_tag_to_index[nspec_tag]
+
+        # Check for valid frame index to avoid try-except
+        if i < len(visit_nspec_vals_sc[nspec_tag_ind]):
+            nspec_val = visit_nspec_vals_sc[nspec_tag_ind][i] # Get the non-spectral pixel value
+            x_spec, y_spec = decoder(spec_tag, x_length) # Get the position of the spectral pixel
+            bck_im[y_spec, x_spec] = nspec_val # Place the non-spectral value in the place of a spectral value
+
+    return bck_im
+
+def createFixedImage(sc_im, background_image, spec_tags, x_length = 2048):
+    '''
+    Create a fixed image by subtracting the background image from the original science image.
+
+    Inputs = sc_im (array [m x n], science frame), background_image (array [m x n], output of createBackgroundImage),
+             spec_tags (array, tags of all the spectral pixels), x_length (int, x axis length of the frame)
+    Output = fixed_im (array [m x n], the fixed image)
+    '''
+
+    # Create the empty canvas for the fixed images
+    fixed_im = np.zeros_like(sc_im)
+
+    # Go through every pixel tag and replace the pixel with the science value - the background value
+    for tag in spec_tags:
+        x, y = decoder(tag, x_length)
+        fixed_im[y, x] = sc_im[y, x] - background_image[y, x]
+
+    return fixed_im
+
+def run(config, comm = None):
+    '''
+    Create the background frames and the fixed frames of a visit (stage 2).
+
+    Inputs = config (dict, output of loadConfig), comm (MPI communicator. None = MPI.COMM_WORLD if mpi4py is installed)
+    Output = data (dict, contents of the output file on the root node. None on the other nodes)
+    '''
+
+    # Initialize parallelization vars
+    # rank = number of node being used
+    # size = total number of nodes being used to run the program
+    if comm is None:
+        comm = getComm()
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+
+    paths = filePaths(config)
+    target, visit, x_length = config['target'], config['visit'], config['x_length']
+
+    # Start decompressing all the data files in the background. The science frames are
+    # only needed at the end, so they keep being read while the background images are created.
+    sc_data = readPickleFileAsync(paths['Science Frames'])
+    proxy_matches_data = readPickleFileAsync(paths['Proxy Matches'] + '.pbz2')
+    visit_spec_nspec_data = readPickleFileAsync(paths['Visit Pixel Values'])
+
+    # Get the data from the files
+    nspec_tags = getTags(paths['Non-Spectral Tags'])
+    spec_tags = getTags(paths['Spectral Tags'])
+    exclude_tags = getTags(paths['Excluded Tags'])
+
+    # Get the matches in order, without the hot pixels
+    spec_tags_ordered_list, nspec_tags_ordered_list = orderProxyMatches(proxy_matches_data.result(), exclude_tags)
+
+    # Create the background images based on the proxy pixel matches
+    visit_nspec_vals_sc = visit_spec_nspec_data.result()[f'v{visit}_nspec_vals_sc']
+    num_frames = len(visit_nspec_vals_sc[0])
+    frames_per_node = np.array_split(np.arange(0, num_frames), size)
+
+    # Precompute the index mapping for nspec_tags
+    nspec_tag_to_index = {tag: index for index, tag in enumerate(nspec_tags)}
+
+    # Every node will create 'frames_per_node' amount of frames
+    background_images = [createBackgroundImage(i, nspec_tags, nspec_tag_to_index, spec_tags_ordered_list, nspec_tags_ordered_list, visit_nspec_vals_sc, x_length)
+                         for i in frames_per_node[rank]]
+
+    # Get the original science frames as well as the frame ids
+    sc_data = sc_data.result()
+    sc_ful_frms, sc_frms_frids = sc_data['Frames'], sc_data['Frame IDs']
+
+    # Index the original science frames to create the equivalent background frames
+    sc_ims_visit = sc_ful_frms[visitFrames(config, sc_frms_frids)]
+    if len(sc_ims_visit) != num_frames:
+        raise ValueError(f'Visit {visit} has {len(sc_ims_visit)} Science Frames but {num_frames} frames of non-spectral pixel values')
+
+    # Have every node create an equal amount of frames (same number of background images created by each node)
+    sc_ims_per_rank = np.array_split(sc_ims_visit, size)
+    sc_ims_rank = sc_ims_per_rank[rank]
+
+    # Create the fixed-background-subtracted images
+    fixed_ims = [createFixedImage(sc_ims_rank[i], background_images[i], spec_tags, x_length) for i in range(len(background_images))]
+
+    # Package the output of every single node to send it to the root node
+    out = [fixed_ims, background_images, rank]
+
+    # Gather all the output arrays to the root node
+    gathered = comm.gather(out, root = 0)
+
+    # Have the root node output the final file
+    if rank == 0:
+        # Processed the gathered data
+        frames = [fixed_frame for frames_per_node in gathered for fixed_frame in frames_per_node[0]]
+        back_ims = [fixed_frame for frames_per_node in gathered for fixed_frame in frames_per_node[1]]
+
+        # Set up the data that will be in the final file
+        data = {'Info': f'Includes original science minus recreated background frames and the recreated background frames themselves for visit {visit} of {target}.',
+                'Fixed Frames': frames,
+                'Background Frames': back_ims}
+
+        # Output the pickle file
+        outputPickleFile(data = data, filename = paths['Fixed Frames Pre Infill'])
+
+        return data
+
+    return None
@@ -0,0 +1,115 @@
+import numpy as np
+from Helper_Function.Helper import readPickleFile, outputPickleFile, doubleGaussCurve
+from cute_pipeline.Config import filePaths
+
+# Bound the double gaussian parameters for faster convergence
+g2_p0 = [150, 50, 20, 0, 150, 62, 20, 0]
+g2_lbound = (10, 40, 0, -15, 10, 50, 0, -15)
+g2_ubound = (400, 70, 50, 15, 400, 80, 50, 15)
+
+def binMedians(frame, x):
+    '''
+    Get the median trace curve of every bin of columns of a frame.
+
+    Inputs = frame (array [m x n]), x (int, number of columns per bin)
+    Output = medians (array, where each index is the median of every row across the columns of a bin)
+    '''
+
+    # Create an array where each index corresponds to the pixel pixels in the corresponding column
+    cols = frame.T.tolist()
+
+    # Get the columns split into 'x' sized bins so that each bin has 'x' number of columns
+    split_cols = [cols[i:i + x] for i in range(0, len(cols), x)]
+
+    # Get the medians of each bin at every row to create a master pix. distribution graph
+    medians = [np.nanmedian(chunk, axis=0) for chunk in split_cols]
+
+    return medians
+
+def fitMedianCurve(x_data, median, random_params):
+    '''
+    Find the best double gaussian fit of a median trace curve with a random search.
+
+    Inputs = x_data (array [1 x n], row indices), median (array [1 x n], median trace curve),
+             random_params (array, where each index is a set of initial parameters to try)
+    Output = [good_fit, good_params] (the best fit curve and its parameters)
+    '''
+    from scipy.optimize import curve_fit # Only imported when fitting
+
+    best_resid = 10000 # Set a worst case best residual value
+    good_fit = np.array([])
+    good_params = None
+
+    # Run the RSM for 'n' times
+    for params in random_params:
+        # Get the fit coefficients
+        popt, _ = curve_fit(doubleGaussCurve, x_data, median, p0=params, bounds=(g2_lbound, g2_ubound), maxfev=100000)
+
+        # Perform a reality check on the coefficients. If they make sense, continue, else, don't bother.
+        if popt[5] < popt[1] + 12:
+            # Create a fit with the coefficients
+            y_fit = doubleGaussCurve(x_data, *popt)
+
+            # Get the residuals between the fit and the data
+            resids = np.sum(np.abs(y_fit - median))
+
+            # If the new residual is better than the best one, the new residual is the new best one
+            if resids < best_resid:
+
+                # Save the fit data if the residual is the best one so far
+                best_resid = resids
+                good_fit = y_fit
+                good_params = popt
+
+    # In the end, save the absolute best fit based on the 'n' number of runs
+    return [good_fit, good_params]
+
+def run(config, n = 10):
+    '''
+    Fit a double gaussian to every bin of columns of the median frame of a visit (stage 3).
+
+    Inputs = config (dict, output of loadConfig), n (int, number of random search runs per bin)
+    Output = data (dict, contents of the output file)
+    '''
+
+    paths = filePaths(config)
+    x = config['bin_columns']
+
+    # Use the same random search every run if there is a seed
+    if config['seed'] is not None:
+        np.random.seed(config['seed'])
+
+    # Get all the fixed-science-minus-recreated-background frames from the pickle file
+    frames_data = readPickleFile(paths['Fixed Frames Pre Infill'] + '.pbz2')
+    frames = frames_data['Fixed Frames']
+
+    # Create a median master frame where each pixel is the median value
+    # of all the fixed-background-subtracted frames
+    med_frame = np.nanmedian(frames, axis = 0)
+
+    # Get the medians of every bin of columns
+    medians = binMedians(med_frame, x)
+
+    # Random search method for a best fit for each curve
+    random_params = np.random.randint(
+        np.array(g2_lbound) + 1,  # Add 1 to lower bounds
+        np.array(g2_ubound) - 1,  # Subtract 1 from upper bounds
+        size=(n, len(g2_lbound))  # Generate a matrix of random parameters
+    )
+
+    # Perform random search method for a best fit for each curve
+    x_data = np.arange(len(med_frame))
+    fits = [fitMedianCurve(x_data, median, random_params) for median in medians]
+
+    # Extract the fits and parameters from the array
+    fit_curves = [chunk[0] for chunk in fits]
+    params = [chunk[1] for chunk in fits]
+
+    data = {'Info': f'Fits and parameters of fits for each median curve trace across the rows of the median frame with {x} columns per bin for visit {config["visit"]} of {config["target"]}.',
+            'Fits': fit_curves,
+            'Params': params}
+
+    # Output the pickle file
+    outputPickleFile(data = data, filename = paths['Median Fits'])
+
+    return data
@@ -0,0 +1,47 @@
+import warnings
+
+'''
+MPI Functions
+'''
+
+class SerialComm:
+    '''
+    Stand-in for MPI.COMM_WORLD with a single process. Lets the parallel stages run (and be
+    benchmarked) on machines without mpi4py.
+    '''
+
+    def Get_rank(self):
+        return 0
+
+    def Get_size(self):
+        return 1
+
+    def bcast(self, data, root = 0):
+        return data
+
+    def gather(self, data, root = 0):
+        return [data]
+
+    def Barrier(self):
+        return
+
+def getComm(parallel = True):
+    '''
+    Get the communicator used by the stages.
+
+    Input = parallel (bool, False = don't even try to use MPI)
+    Output = comm (MPI.COMM_WORLD, or a SerialComm if mpi4py isn't installed or parallel is False)
+
+    mpi4py is only imported here, so the sequential stages don't pay for initializing MPI.
+    '''
+
+    if not parallel:
+        return SerialComm()
+
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        warnings.warn('mpi4py is not installed, running on a single process')
+        return SerialComm()
+
+    return MPI.COMM_WORLD
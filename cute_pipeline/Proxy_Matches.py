@@ -0,0 +1,305 @@
+import os
+import numpy as np
+from Helper_Function.Helper import getTags, outputPickleFile, decoder, buildColumnIndex, nearbyPixels
+from Helper_Function.Async_IO import readPickleFileAsync
+from Helper_Function.Checkpoint import Checkpointer, checkpointFile, startCheckpoints, clearCheckpoints
+from cute_pipeline.Config import filePaths
+from cute_pipeline.Parallel import getComm
+
+def getPixData(paths):
+    '''
+    Get the pixel data from the pre-selected files.
+
+    Inputs = paths (dict, output of filePaths)
+    Outputs =  spec_vals_dk (array where each index contains the pixel values for the specific spectral pixel in a dark frame), 
+               nspec_vals_dk (array where each index contains the pixel values for the specific non-spectral pixel in a dark frame), 
+               spec_tags (array where each index contains a pixel tag for the spectral pixels), 
+               nspec_tags (array where each index contains a pixel tag for the non-spectral pixels).
+
+               The order of the tags is directly related to the order of the pixels in the non-tag output arrays.
+               i.e. If spec_tags[10] = 10, then the pixel tag for spec_vals_dk is 10.
+    '''
+    # Start decompressing the pixel data in the background
+    pix_data = readPickleFileAsync(paths['Dark Pixel Values'])
+
+    # Get the spectral pixel tags
+    spec_tags = getTags(paths['Spectral Tags'])
+
+    # Get the non-spectral pixel tags
+    nspec_tags = getTags(paths['Non-Spectral Tags'])
+
+    # Wait for the pixel data and process it
+    pix_data = pix_data.result()
+    spec_vals_dk = np.array(pix_data['Spectral Pixels in Dark Frames'])
+    nspec_vals_dk = np.array(pix_data['Non-Spectral Pixels in Dark Frames'])
+
+    return spec_vals_dk, nspec_vals_dk, spec_tags, nspec_tags
+
+# Get the best match between a single spectral pixel and all its comparisons with non spectral pixels 
+def getBestMatch(spec_tag, nspec_tags, medians_arr, stds_arr):
+    '''
+    Get the best statistical match base on the median and standard deviation of the residuals array.
+
+    Inputs = spec_tag (int, tag of spectral pixel), nspec_tags (array, tags of all non-spectral pixels being compared to the spectral pixel)
+             medians_arr (array, array of medians where each index is the median of a residual array), 
+             stds_arr (array, array of standard deviations where each index is the standard deviation of a residual array).
+    Output = best_match (dict) -> 'Combo' (tuple, the first index is the spectral tag, the second is the non spectral tag, the pair have the best match), 
+                                  'Median' (float, the median of the best match)
+                                  'STD' (float, the standard deviation of the best match)
+
+    This function will determine the best match based on two filters. First, we look at the medians closest to 0, preferably 0. Of those medians,
+    we select the match that has the smallest standard deviation.  
+    '''
+
+    # Lists used
+    min_median_stds = []
+    
+    # Get the smallest median value closest to zero and its indices
+    min_median = min(medians_arr)
+    min_median_idxs = np.argwhere(medians_arr == min_median)
+
+    # For every minimum median value (assumming multiple), find the smallest std of them all
+    for i in range(len(min_median_idxs)):
+        # Access the index
+        idx = min_median_idxs[i][0]
+        # Create an array that contains all the stds of all the minimum medians
+        min_median_stds.append(stds_arr[idx])
+
+    # Get the index at which the std is the smallest ONLY when comparing across minimum medians
+    min_median_std_idx = min_median_stds.index(min(min_median_stds))
+    
+    # Edge case for there is only one minimum median
+    if len(min_median_idxs) == 1:
+        # Get the value
+        index = min_median_idxs[0][0]
+    else:
+        # Turn the index value into an int
+        index = min_median_idxs[min_median_std_idx][0]
+        
+    # Finally, get the values for the best match using the best match index 
+    min_median = medians_arr[index]
+    min_std = stds_arr[index]
+    nspec_tag = nspec_tags[index]
+    match = (spec_tag, nspec_tag)
+    best_match = {'Combo': match, 'Median': min_median, 'STD': min_std}
+
+    return best_match
+
+def getBestMatchLSQ(spec_tag, nspec_tags, residuals, LSQ_list):
+    '''
+    Function that calculates the best match based on the smallest least squares error.
+
+    Inputs = spec_tag (int, tag of spectral pixel), nspec_tags (array, tags of all non-spectral pixels being compared to the spectral pixel),
+             residuals (array, where each index is the residual between the spectral pixel and the corresponding spectral pixel),
+             LSQ_list (array, each index is the least squares error for the corresponding spectral and nonspectral pixel matches).
+    Outputs = best_match_package (dict) -> 'Combo' (tuple, the first index is the spectral tag, the second is the non spectral tag, the pair have the best match),
+                                           'LSQ' (float, value of least squares error for the best match).
+    '''
+
+    # Count the number of NaNs in each sub-array
+    non_nan_counts = 134 - np.sum(np.isnan(residuals), axis=1)
+    
+    # Get the normalized LSQs. Do this so that the comparison is fair, even if some pixel values are missing
+    norm_LSQ_list = LSQ_list / non_nan_counts
+
+    # Get the index smallest normalized LSQ
+    best_residual_idx = np.argmin(norm_LSQ_list)
+    
+    # Create the best match package
+    nspec_tag = nspec_tags[best_residual_idx]
+    best_lsq = LSQ_list[best_residual_idx]
+    match = (spec_tag, nspec_tag)
+    best_match_package = {'Combo': match, 'LSQ': best_lsq}
+
+    return best_match_package
+
+def matchPixel(spec_tag, spec_vals, nspec_tags, nspec_vals):
+    '''
+    Find the proxy non-spectral pixel of a single spectral pixel.
+
+    Inputs = spec_tag (int, tag of spectral pixel), spec_vals (array, pixel values of the spectral pixel in every dark frame),
+             nspec_tags (array, tags of the non-spectral pixels being compared to the spectral pixel),
+             nspec_vals (array, where each index is the pixel values of the corresponding non-spectral pixel in every dark frame)
+    Output = best_match (dict, see getBestMatch)
+    '''
+    residuals = spec_vals - nspec_vals # Subtract every non spectral values from the specific spectral pixel values 
+
+    '''
+    LSQ Method
+    '''
+    # LSQ Method
+    # LSQs = np.nansum(np.square(residuals), axis = 1)
+    # best_match = getBestMatchLSQ(spec_tag, nspec_tags, residuals, LSQs)
+    
+    '''
+    Median Method
+    '''
+    # Median Method
+    medians_arr = abs(np.nanmedian(residuals, axis = 1)) # Get the medians of all the residuals
+    stds_arr = abs(np.nanstd(residuals, axis = 1)) # Get the standard deviation of all the residuals
+    best_match = getBestMatch(spec_tag, nspec_tags, medians_arr, stds_arr) # Compute the best match
+
+    return best_match
+
+def getMatches(proxy_matches_data):
+    '''
+    Get the matches out of a stage 1 output file.
+
+    Input = proxy_matches_data (contents of the Proxy Matches file. The exhaustive search saves the list of matches of every node,
+                                the approximate search saves a dict with that list in 'Matches' and the validation counts)
+    Output = matches (array, where each index is the list of best matches found by one node)
+    '''
+    if isinstance(proxy_matches_data, dict):
+        return proxy_matches_data['Matches']
+    return proxy_matches_data
+
+def run(config, comm = None):
+    '''
+    Find the proxy non-spectral pixel of every spectral pixel using the Dark Frames (stage 1).
+
+    Inputs = config (dict, output of loadConfig), comm (MPI communicator. None = MPI.COMM_WORLD if mpi4py is installed)
+    Output = gathered (array, on the root node. Each index is the list of best matches found by one node. None on the other nodes)
+
+    In approximate mode the output file is a dict with the same list in 'Matches' and the number of spectral pixels that were
+    checked against the exhaustive search in 'Validated' ('Mismatches' of them got a different match). See getMatches.
+
+    Settings used: 'approximate', 'column_window', 'row_radius', 'validation_step' (approximate search mode. validation_step 0 = no checks)
+                   'resume', 'fresh_start', 'merge_partial', 'checkpoint_interval' (checkpoint/restart)
+    '''
+
+    # Initialize parallelization vars
+    # rank = number of processor being used
+    # size = total number of processors being used to run the program
+    if comm is None:
+        comm = getComm()
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+
+    approximate = config['approximate']
+    merge_partial = config['merge_partial']
+    x_length = config['x_length']
+    validation_step = config['validation_step']
+
+    # Name of the output file (and of the checkpoint files)
+    paths = filePaths(config)
+    output_name = os.path.basename(paths['Proxy Matches'])
+    checkpoint_dir = paths['Checkpoints']
+
+    # Preallocate for all non root nodes
+    spec_vals_dk = None
+    nspec_vals_dk = None
+    spec_tags = None
+    nspec_tags = None
+    done = None
+    error = None
+
+    if rank == 0:
+        try:
+            # Get the matches found by previous runs, or start from scratch
+            done = startCheckpoints(output_name, checkpoint_dir, config['resume'] or merge_partial, config['fresh_start'])
+
+            if merge_partial:
+                # Only the tags are needed to put the checkpointed matches in order
+                spec_tags, nspec_tags = getTags(paths['Spectral Tags']), getTags(paths['Non-Spectral Tags'])
+            else:
+                # Get the big data arrays. Have the root node handle the data
+                spec_vals_dk, nspec_vals_dk, spec_tags, nspec_tags = getPixData(paths)
+        except RuntimeError as e:
+            error = str(e)
+
+    # Stop every node if the root node can't start
+    error = comm.bcast(error, root = 0)
+    if error is not None:
+        raise RuntimeError(error)
+
+    # Broadcast all the necessary data from the root node to the other nodes.
+    spec_vals = comm.bcast(spec_vals_dk, root = 0)
+    spec_tags = comm.bcast(spec_tags, root = 0)
+    nspec_vals = comm.bcast(nspec_vals_dk, root = 0)
+    nspec_tags = comm.bcast(nspec_tags, root = 0)
+    done = comm.bcast(done, root = 0)
+
+    # Create the chunks of spectral pixels for each node 
+    chunks_per_node_spec_tags = np.array_split(spec_tags, size)
+    if not merge_partial:
+        chunks_per_node_spec_vals = np.array_split(spec_vals, size)
+
+    # Reassign the array for each processor. This way each processor knows what they have to analyze after splitting the load above.
+    spec_tags_chunks = chunks_per_node_spec_tags[rank]
+    if not merge_partial:
+        spec_vals_chunks = chunks_per_node_spec_vals[rank]
+
+    # Index the non-spectral pixels by column for the approximate search
+    if approximate:
+        nspec_index = buildColumnIndex(nspec_tags, x_length)
+
+    # Find residuals and best matc
+    best_matches_arr = []
+    validated = 0
+    mismatches = 0
+
+    # Matches of this node, by spectral pixel tag, that get saved to this node's checkpoint file
+    node_done = {}
+
+    # The last checkpoint is saved when the loop ends, also if it stops with an error
+    with Checkpointer(checkpointFile(output_name, f'rank{rank}_of_{size}', checkpoint_dir), node_done, config['checkpoint_interval']) as checkpointer:
+        for i in range(len(spec_tags_chunks)):
+            spec_tag = spec_tags_chunks[i] # Get a specific spectral pixel tag
+
+            # Skip the spectral pixels that were matched before the restart
+            if spec_tag in done:
+                node_done[spec_tag] = done[spec_tag]
+                best_matches_arr.append(done[spec_tag])
+                continue
+            elif merge_partial:
+                continue
+
+            if approximate:
+                # Only compare against the non-spectral pixels around the spectral pixel
+                x, y = decoder(spec_tag, x_length)
+                candidates = nearbyPixels(nspec_index, x, y, config['column_window'], config['row_radius'])
+
+            if approximate and len(candidates):
+                best_match = matchPixel(spec_tag, spec_vals_chunks[i], [nspec_tags[c] for c in candidates], nspec_vals[candidates])
+
+                # Check a sample of the approximate answers against the exhaustive search
+                if validation_step > 0 and i % validation_step == 0:
+                    exhaustive_match = matchPixel(spec_tag, spec_vals_chunks[i], nspec_tags, nspec_vals)
+                    validated += 1
+                    mismatches += exhaustive_match['Combo'] != best_match['Combo']
+            else:
+                best_match = matchPixel(spec_tag, spec_vals_chunks[i], nspec_tags, nspec_vals)
+
+            best_matches_arr.append(best_match) # Append to final results list
+
+            # Save the progress every once in a while
+            node_done[spec_tag] = best_match
+            checkpointer.update()
+
+    # Gather all the master_arr arrays to the root node for outputting
+    gathered = comm.gather(best_matches_arr, root=0)
+    validation = comm.gather((validated, mismatches), root=0)
+
+    # Have the root node output the final file
+    if rank == 0:
+        if approximate:
+            # Report how often the approximate search disagrees with the exhaustive search
+            validated, mismatches = np.sum(validation, axis = 0)
+            print(f'Approximate search: {mismatches} of {validated} validated spectral pixels '
+                  f'({100 * mismatches / max(validated, 1):.2f}%) have a different proxy match than the exhaustive search')
+
+        # Create pickle file. The quick-look results are kept apart from the full results by their name.
+        if approximate:
+            rows = 'every row' if config['row_radius'] is None else f'{config["row_radius"]} rows'
+            outputPickleFile({'Info': f'Approximate proxy pixel matches of every node, searched within {config["column_window"]} columns '
+                                      f'and {rows} of every spectral pixel, with the number of matches checked against '
+                                      f'the exhaustive search and how many of them differ.',
+                              'Matches': gathered, 'Validated': int(validated), 'Mismatches': int(mismatches)}, paths['Proxy Matches'])
+        else:
+            outputPickleFile(gathered, paths['Proxy Matches'])
+
+        # The checkpoints are not needed anymore once the full results are out
+        if not merge_partial:
+            clearCheckpoints(output_name, checkpoint_dir)
+
+    return gathered
@@ -0,0 +1,565 @@
+import csv
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import numpy as np
+from Helper_Function.Helper import readPickleFile, outputPickleFile, getTags, decoder
+from cute_pipeline.Config import filePaths
+from cute_pipeline.Parallel import SerialComm
+from cute_pipeline.Proxy_Matches import getMatches
+
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+
+'''
+Settings
+'''
+
+# Tolerances used to compare the outputs against the golden files. The fits are only compared with
+# the same seed (see RANDOM_STAGES), their looser tolerances absorb the differences of curve_fit
+# between machines and library versions. They can't absorb a different random search.
+TOLERANCES = {
+    'fit_rtol': 1e-3,
+    'fit_atol': 1e-2,
+    'frame_rtol': 1e-6,
+    'frame_atol': 1e-6,
+}
+
+# Name of the file that marks a data folder as a fixture (see makeFixture)
+FIXTURE_FILE = 'fixture.json'
+
+# Folder of the reference outputs, only read unless another golden folder is given
+GOLDEN_DIR = 'Results'
+
+# Folder inside a fixture where --bless writes the golden files of that fixture
+FIXTURE_GOLDEN_DIR = 'Golden'
+
+# File of a golden folder with the settings every golden file was blessed with
+GOLDEN_INFO_FILE = 'golden.json'
+
+# Budgets file used by 'cute-pipeline regress' when no other one is given (see README)
+BUDGETS_FILE = 'budgets.json'
+
+# Stages whose outputs come from the random search of the gaussian fits. They can only be
+# compared against golden files that were blessed with the same seed.
+RANDOM_STAGES = ('stage3', 'stage4')
+
+'''
+Comparison Functions
+'''
+
+def _allClose(output, golden, rtol, atol):
+    '''
+    Check that two arrays (or two Nones) have the same shape and values within tolerance. NaNs must match.
+    '''
+    if output is None or golden is None:
+        return output is None and golden is None
+
+    output, golden = np.asarray(output, dtype = float), np.asarray(golden, dtype = float)
+
+    return output.shape == golden.shape and np.allclose(output, golden, rtol = rtol, atol = atol, equal_nan = True)
+
+def compareProxyMatches(output, golden, tolerances):
+    '''
+    Compare the proxy pixel pairs of stage 1. The pairs must be exactly the same.
+
+    Inputs = output, golden (contents of the stage 1 output files, see getMatches. The number of nodes can differ),
+             tolerances (dict, not used)
+    Output = problems (array of strings, empty if the outputs match)
+    '''
+
+    # Flatten the lists of every node. The order of the spectral pixels doesn't depend on the number of nodes
+    output = [tuple(int(tag) for tag in match['Combo']) for node_matches in getMatches(output) for match in node_matches]
+    golden = [tuple(int(tag) for tag in match['Combo']) for node_matches in getMatches(golden) for match in node_matches]
+
+    if len(output) != len(golden):
+        return [f'{len(output)} proxy pairs instead of {len(golden)}']
+
+    different = sum(out != gold for out, gold in zip(output, golden))
+    if different:
+        return [f'{different} of {len(golden)} proxy pairs are different']
+
+    return []
+
+def compareFrames(output, golden, tolerances):
+    '''
+    Compare the Fixed and Background Frames of stage 2.
+    '''
+
+    problems = []
+    for key in ('Fixed Frames', 'Background Frames'):
+        if len(output[key]) != len(golden[key]):
+            problems.append(f'{len(output[key])} {key} instead of {len(golden[key])}')
+            continue
+
+        different = sum(not _allClose(out, gold, tolerances['frame_rtol'], tolerances['frame_atol']) for out, gold in zip(output[key], golden[key]))
+        if different:
+            problems.append(f'{different} of {len(golden[key])} {key} are different')
+
+    return problems
+
+def compareMedianFits(output, golden, tolerances):
+    '''
+    Compare the median frame fits of stage 3 (fit curves and parameters of every bin).
+    '''
+
+    problems = []
+    for key in ('Fits', 'Params'):
+        if len(output[key]) != len(golden[key]):
+            problems.append(f'{len(output[key])} bins of {key} instead of {len(golden[key])}')
+            continue
+
+        different = sum(not _allClose(out, gold, tolerances['fit_rtol'], tolerances['fit_atol']) for out, gold in zip(output[key], golden[key]))
+        if different:
+            problems.append(f'{different} of {len(golden[key])} bins of {key} are different')
+
+    return problems
+
+def compareFixedFits(output, golden, tolerances):
+    '''
+    Compare the fixed frame fits of stage 4 (fit curve, parameters and filtered column of every bin of every frame).
+    '''
+
+    if len(output['Fits']) != len(golden['Fits']):
+        return [f'Fits of {len(output["Fits"])} frames instead of {len(golden["Fits"])}']
+
+    different_fits, different_cols, bins = 0, 0, 0
+    for out_frame, gold_frame in zip(output['Fits'], golden['Fits']):
+        if out_frame is None or gold_frame is None or len(out_frame) != len(gold_frame):
+            return ['The frames have a different number of bins (or were not fitted)']
+
+        for (out_fit, out_params, out_col), (gold_fit, gold_params, gold_col) in zip(out_frame, gold_frame):
+            bins += 1
+            different_fits += not (_allClose(out_fit, gold_fit, tolerances['fit_rtol'], tolerances['fit_atol'])
+                                   and _allClose(out_params, gold_params, tolerances['fit_rtol'], tolerances['fit_atol']))
+            different_cols += not _allClose(out_col, gold_col, tolerances['frame_rtol'], tolerances['frame_atol'])
+
+    problems = []
+    if different_fits:
+        problems.append(f'{different_fits} of {bins} bin fits are different')
+    if different_cols:
+        problems.append(f'{different_cols} of {bins} filtered bin medians are different')
+
+    return problems
+
+def compareFinalFrames(output, golden, tolerances):
+    '''
+    Compare the Final Frames of stage 5.
+    '''
+
+    if len(output) != len(golden):
+        return [f'{len(output)} Final Frames instead of {len(golden)}']
+
+    different = sum(not _allClose(out, gold, tolerances['frame_rtol'], tolerances['frame_atol']) for out, gold in zip(output, golden))
+    if different:
+        return [f'{different} of {len(golden)} Final Frames are different']
+
+    return []
+
+'''
+Fixture Functions
+'''
+
+def restrictProxyMatches(data, columns, config):
+    '''
+    Keep the proxy pixel pairs of the spectral pixels in the first 'columns' columns.
+
+    Inputs = data (output of a stage, or its golden file), columns (int, number of columns of the fixture),
+             config (dict, output of loadConfig)
+    Output = data (same type as the input, restricted to the fixture)
+    '''
+    matches = [[match for match in node_matches if decoder(match['Combo'][0], config['x_length'])[0] < columns] for node_matches in getMatches(data)]
+
+    # The approximate search output keeps its validation counts
+    return dict(data, Matches = matches) if isinstance(data, dict) else matches
+
+def restrictFrames(data, columns, config):
+    '''
+    Keep the first 'columns' columns of the Fixed and Background Frames of stage 2.
+    '''
+    return dict(data, **{key: [frame[:, :columns] for frame in data[key]] for key in ('Fixed Frames', 'Background Frames')})
+
+def restrictMedianFits(data, columns, config):
+    '''
+    Keep the median frame fits of the bins in the first 'columns' columns.
+    '''
+    bins = columns // config['bin_columns']
+    return dict(data, Fits = data['Fits'][:bins], Params = data['Params'][:bins])
+
+def restrictFixedFits(data, columns, config):
+    '''
+    Keep the fixed frame fits of the bins in the first 'columns' columns of every frame.
+    '''
+    bins = columns // config['bin_columns']
+    return dict(data, Fits = [None if frame_fits is None else frame_fits[:bins] for frame_fits in data['Fits']])
+
+def restrictFinalFrames(data, columns, config):
+    '''
+    Keep the first 'columns' columns of the Final Frames of stage 5.
+    '''
+    return tuple(None if frame is None else frame[:, :columns] for frame in data)
+
+def fixtureColumns(config):
+    '''
+    Get the number of columns of the fixture in the data folder of a run. None = the data folder is not a fixture.
+    '''
+    file = os.path.join(config['data_dir'], FIXTURE_FILE)
+    if not os.path.exists(file):
+        return None
+
+    with open(file, mode='r') as f:
+        return json.load(f)['columns']
+
+def makeFixture(config, fixture_dir, columns = 200):
+    '''
+    Create a small copy of the input data for quick regression checks.
+
+    Inputs = config (dict, output of loadConfig. 'data_dir' points to the full data),
+             fixture_dir (string, folder of the fixture), columns (int, number of columns of the detector kept in the fixture)
+
+    The fixture only keeps the spectral pixels in the first 'columns' columns (every non-spectral pixel
+    is kept, since any of them can be a proxy). runRegression restricts the golden files and the
+    stage inputs/outputs to the same columns, so stage 1 only matches those spectral pixels and
+    stages 3 to 5 only fit/infill those bins. The Science Frames and the visit's pixel values are copied as is.
+    '''
+
+    if columns % config['bin_columns'] or not 0 < columns <= config['x_length']:
+        raise ValueError(f'The fixture columns must be a multiple of {config["bin_columns"]} between 1 and {config["x_length"]}')
+
+    paths = filePaths(config)
+    fixture_paths = filePaths(dict(config, data_dir = fixture_dir))
+    os.makedirs(fixture_dir, exist_ok = True)
+
+    # Keep the spectral pixels in the first columns
+    spec_tags = getTags(paths['Spectral Tags'])
+    keep = [i for i, tag in enumerate(spec_tags) if decoder(tag, config['x_length'])[0] < columns]
+    with open(fixture_paths['Spectral Tags'], mode='w', newline='') as f:
+        csv.writer(f).writerows([[spec_tags[i]] for i in keep])
+
+    # Keep their values in the Dark Frames, which are in the same order as the tags
+    pix_data = readPickleFile(paths['Dark Pixel Values'])
+    pix_data['Spectral Pixels in Dark Frames'] = np.asarray(pix_data['Spectral Pixels in Dark Frames'])[keep]
+    outputPickleFile(pix_data, fixture_paths['Dark Pixel Values'][:-len('.pbz2')])
+
+    for key in ('Non-Spectral Tags', 'Excluded Tags', 'Science Frames', 'Visit Pixel Values'):
+        shutil.copy(paths[key], fixture_paths[key])
+
+    with open(os.path.join(fixture_dir, FIXTURE_FILE), mode='w') as f:
+        json.dump({'columns': columns, 'spectral pixels': len(keep), 'source': paths['Dark Pixel Values']}, f, indent = 4)
+
+    return
+
+# Output file (key of filePaths), comparison function and fixture restriction function of every stage
+STAGE_OUTPUTS = {
+    'stage1': ('Proxy Matches', compareProxyMatches, restrictProxyMatches),
+    'stage2': ('Fixed Frames Pre Infill', compareFrames, restrictFrames),
+    'stage3': ('Median Fits', compareMedianFits, restrictMedianFits),
+    'stage4': ('Fixed Frames Fits', compareFixedFits, restrictFixedFits),
+    'stage5': ('Final Frames', compareFinalFrames, restrictFinalFrames),
+}
+
+# Input files (keys of filePaths) of every stage. A stage is skipped if one of them is missing.
+STAGE_INPUTS = {
+    'stage1': ('Spectral Tags', 'Non-Spectral Tags', 'Dark Pixel Values'),
+    'stage2': ('Spectral Tags', 'Non-Spectral Tags', 'Excluded Tags', 'Science Frames', 'Visit Pixel Values', 'Proxy Matches'),
+    'stage3': ('Fixed Frames Pre Infill',),
+    'stage4': ('Fixed Frames Pre Infill', 'Median Fits'),
+    'stage5': ('Fixed Frames Pre Infill', 'Fixed Frames Fits'),
+}
+
+'''
+Golden File Functions
+'''
+
+def goldenInfo(golden_dir):
+    '''
+    Get the settings the golden files of a folder were blessed with.
+
+    Input = golden_dir (string, folder of the golden files)
+    Output = info (dict, where each key is a stage and each value is a dict with the 'seed', 'frames' and 'columns'
+             (fixture columns, None = full data) of its golden file. Empty if nothing was blessed in the folder, e.g. Results)
+    '''
+    file = os.path.join(golden_dir, GOLDEN_INFO_FILE)
+    if not os.path.exists(file):
+        return {}
+
+    with open(file, mode='r') as f:
+        return json.load(f)
+
+def _saveGoldenInfo(golden_dir, stage, config, columns):
+    '''
+    Record the settings a golden file was blessed with (see goldenInfo).
+    '''
+    info = goldenInfo(golden_dir)
+    info[stage] = {'seed': config['seed'], 'frames': config['frames'], 'columns': columns}
+    with open(os.path.join(golden_dir, GOLDEN_INFO_FILE), mode='w') as f:
+        json.dump(info, f, indent = 4)
+
+def _goldenFile(name, golden_dir, fixture_golden_dir):
+    '''
+    Get the path of a golden file. The golden files blessed on a fixture take priority over the (restricted) full golden files.
+    '''
+    if fixture_golden_dir is not None and os.path.exists(os.path.join(fixture_golden_dir, name)):
+        return os.path.join(fixture_golden_dir, name)
+    return os.path.join(golden_dir, name)
+
+'''
+Measuring Functions
+'''
+
+def _peakMemory(children = False):
+    '''
+    Get the peak memory in MB of this process, or of its largest finished child process (children = True).
+    None if it can't be measured on this OS.
+    '''
+    if resource is None:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    memory_mb = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss / 1024
+    if sys.platform == 'darwin':
+        memory_mb /= 1024
+
+    return memory_mb
+
+def _runStage(stage, config, launcher, results):
+    '''
+    Run a stage and send its wall time and peak memory back to the parent process.
+    '''
+    from cute_pipeline.CLI import STAGES
+
+    try:
+        module_name, parallel = STAGES[stage]
+        start = time.perf_counter()
+
+        if parallel and launcher:
+            # Run the stage with MPI through the command line, with the same settings
+            config_file = os.path.join(config['results_dir'], f'{stage}_config.json')
+            with open(config_file, mode='w') as f:
+                json.dump(config, f)
+            subprocess.run(launcher + [sys.executable, '-m', 'cute_pipeline', 'run', stage, '--config', config_file], check = True)
+            seconds = time.perf_counter() - start
+            memory_mb = _peakMemory(children = True)
+        else:
+            module = importlib.import_module(module_name)
+            if parallel:
+                module.run(config, SerialComm())
+            else:
+                module.run(config)
+            seconds = time.perf_counter() - start
+            memory_mb = _peakMemory()
+
+        results.put((seconds, memory_mb, None))
+    except BaseException:
+        results.put((None, None, traceback.format_exc()))
+
+def measureStage(stage, config, launcher = None):
+    '''
+    Run a single stage in a fresh process and measure it.
+
+    Inputs = stage (string, e.g. 'stage1'), config (dict, output of loadConfig),
+             launcher (array, MPI launcher of the parallel stages e.g. ['mpiexec', '-n', '96']. None = run them on a single process)
+    Outputs = seconds (float, wall time of the stage, including its imports),
+              memory_mb (float, peak memory in MB of the process, or of the largest MPI process. None if it can't be measured on this OS)
+
+    Every stage gets a new process so the peak memory of one stage doesn't hide the peak memory of the next.
+    Raises a RuntimeError if the stage fails.
+    '''
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target = _runStage, args = (stage, config, launcher, results))
+    process.start()
+
+    # Wait for the results, unless the process dies without sending them (e.g. killed for using too much memory)
+    while True:
+        try:
+            seconds, memory_mb, error = results.get(timeout = 1)
+            break
+        except queue.Empty:
+            if not process.is_alive() and results.empty():
+                raise RuntimeError(f'{stage} died with exit code {process.exitcode}')
+    process.join()
+
+    if error is not None:
+        raise RuntimeError(f'{stage} failed:\n{error}')
+
+    return seconds, memory_mb
+
+'''
+Regression Functions
+'''
+
+def _inputFile(paths, key):
+    '''
+    Get the path of an input file of a stage. The stage outputs don't have the .pbz2 extension in filePaths.
+    '''
+    if any(key == output_key for output_key, _, _ in STAGE_OUTPUTS.values()):
+        return paths[key] + '.pbz2'
+    return paths[key]
+
+def _putFile(source, destination, restrict, columns, config):
+    '''
+    Copy a stage output, restricted to the fixture columns if there are any.
+    '''
+    if columns is None:
+        shutil.copy(source, destination)
+    else:
+        outputPickleFile(restrict(readPickleFile(source), columns, config), destination[:-len('.pbz2')])
+
+def runRegression(stages, config, golden_dir = None, budgets = None, tolerances = None, bless = False, launcher = None):
+    '''
+    Rerun stages of the pipeline and compare their outputs and performance against golden files.
+
+    Inputs = stages (array, names of the stages e.g. ['stage1', 'stage3']),
+             config (dict, output of loadConfig. 'data_dir' points to the input data, either the full data or a fixture made by makeFixture),
+             golden_dir (string, folder with the golden outputs. None = the reference archives in GOLDEN_DIR),
+             budgets (dict, e.g. {'stage1': {'seconds': 600, 'memory_mb': 4000}}. Stages without a budget aren't checked),
+             tolerances (dict, overrides of TOLERANCES),
+             bless (bool, True = replace the golden files with the new outputs instead of comparing them. On a fixture the
+                    new golden files go in its FIXTURE_GOLDEN_DIR folder. On the full data golden_dir must be given),
+             launcher (array, MPI launcher of stages 1 and 2 e.g. ['mpiexec', '-n', '96']. None = run them on a single process)
+    Output = report (array, where each index is a dict with the 'Stage', 'Seconds', 'Memory MB', 'Processes' (how a parallel
+             stage was run, None for the sequential stages), 'Problems' and 'Skipped' (reason the stage didn't run, or None) of a stage)
+
+    The stages write to a scratch folder that starts with a copy of the golden files, and the golden
+    output of every stage is put back after it is compared. This way, every stage gets the golden
+    inputs and a difference in one stage doesn't show up again in the stages after it. A stage is
+    skipped if it has no golden file to compare against or if one of its inputs is missing. The stages
+    in RANDOM_STAGES are also skipped unless their golden file was blessed with the same seed as the run.
+
+    If the data folder is a fixture, the golden files blessed on the fixture are used first, then the
+    golden files in golden_dir. The golden files and the outputs are restricted to the columns of the
+    fixture before they are compared or handed to the next stage.
+    '''
+
+    from cute_pipeline.CLI import STAGES
+
+    budgets = budgets or {}
+    tolerances = dict(TOLERANCES, **(tolerances or {}))
+    columns = fixtureColumns(config)
+    fixture_golden_dir = None if columns is None else os.path.join(config['data_dir'], FIXTURE_GOLDEN_DIR)
+
+    # The reference archives are never replaced by accident
+    if bless and columns is None and golden_dir is None:
+        raise ValueError(f'Blessing the full data needs a golden folder, the files in {GOLDEN_DIR} are only replaced if it is given explicitly')
+    golden_dir = golden_dir or GOLDEN_DIR
+    bless_dir = fixture_golden_dir or golden_dir
+
+    # Copy the golden files into the scratch folder
+    scratch_dir = tempfile.mkdtemp(prefix = 'cute_regression_')
+    config = dict(config, results_dir = scratch_dir)
+    paths = filePaths(config)
+    golden_files = {stage: _goldenFile(os.path.basename(paths[key]) + '.pbz2', golden_dir, fixture_golden_dir) for stage, (key, _, _) in STAGE_OUTPUTS.items()}
+    for stage, golden_file in golden_files.items():
+        key, _, restrict = STAGE_OUTPUTS[stage]
+        if os.path.exists(golden_file):
+            _putFile(golden_file, paths[key] + '.pbz2', restrict, columns, config)
+
+    report = []
+    try:
+        for stage in stages:
+            key, compare, restrict = STAGE_OUTPUTS[stage]
+            output_file = paths[key] + '.pbz2'
+            golden_file = golden_files[stage]
+            parallel = STAGES[stage][1]
+            row = {'Stage': stage, 'Seconds': None, 'Memory MB': None, 'Problems': [], 'Skipped': None, 'Processes': None}
+            if parallel:
+                row['Processes'] = ' '.join(launcher) if launcher else '1 process, no MPI launcher'
+            report.append(row)
+
+            # Skip the stages that can't be checked
+            missing = [input_key for input_key in STAGE_INPUTS[stage] if not os.path.exists(_inputFile(paths, input_key))]
+            if missing:
+                row['Skipped'] = f'missing input: {", ".join(missing)}'
+                continue
+            if not bless and not os.path.exists(golden_file):
+                row['Skipped'] = f'no golden file {golden_file}'
+                continue
+            if not bless and stage in RANDOM_STAGES:
+                # The fits of two runs with different seeds differ in almost every bin
+                golden_seed = goldenInfo(os.path.dirname(golden_file)).get(stage, {}).get('seed')
+                if golden_seed is None:
+                    row['Skipped'] = f'{golden_file} was not blessed with a seed, bless the stage with --seed to compare its random search'
+                    continue
+                if golden_seed != config['seed']:
+                    row['Skipped'] = f'{golden_file} was blessed with seed {golden_seed}, run with --seed {golden_seed} to compare its random search'
+                    continue
+
+            # Remove the golden output so the comparison can't pass without the stage writing a new one
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+            try:
+                row['Seconds'], row['Memory MB'] = measureStage(stage, config, launcher if parallel else None)
+            except RuntimeError as e:
+                row['Problems'].append(str(e).strip())
+            else:
+                # Compare the output against the golden file
+                if bless:
+                    golden_file = golden_files[stage] = os.path.join(bless_dir, os.path.basename(output_file))
+                    os.makedirs(bless_dir, exist_ok = True)
+                    _putFile(output_file, golden_file, restrict, columns, config)
+                    _saveGoldenInfo(bless_dir, stage, config, columns)
+                else:
+                    output, golden = readPickleFile(output_file), readPickleFile(golden_file)
+                    if columns is not None:
+                        output, golden = restrict(output, columns, config), restrict(golden, columns, config)
+                    row['Problems'] += compare(output, golden, tolerances)
+
+                # Check the budgets
+                budget = budgets.get(stage, {})
+                if 'seconds' in budget and row['Seconds'] > budget['seconds']:
+                    row['Problems'].append(f'took {row["Seconds"]:.1f} s, budget is {budget["seconds"]} s')
+                if 'memory_mb' in budget:
+                    if row['Memory MB'] is None:
+                        row['Problems'].append('peak memory cannot be measured on this OS')
+                    elif row['Memory MB'] > budget['memory_mb']:
+                        row['Problems'].append(f'peak memory was {row["Memory MB"]:.0f} MB, budget is {budget["memory_mb"]} MB')
+
+            # The next stages get the golden output as input (restricted to the fixture), even if this stage failed
+            if os.path.exists(golden_file):
+                _putFile(golden_file, output_file, restrict, columns, config)
+            elif columns is not None and os.path.exists(output_file):
+                _putFile(output_file, output_file, restrict, columns, config)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors = True)
+
+    return report
+
+def printReport(report):
+    '''
+    Print the report of runRegression. Returns True if none of the stages failed (skipped stages don't fail).
+    '''
+
+    passed = True
+    for row in report:
+        if row['Skipped'] is not None:
+            print(f'{row["Stage"]}: skipped ({row["Skipped"]})')
+            continue
+
+        status = 'FAIL' if row['Problems'] else 'ok'
+        if row['Seconds'] is None:
+            print(f'{row["Stage"]}: {status}')
+        else:
+            memory = 'n/a' if row['Memory MB'] is None else f'{row["Memory MB"]:.0f} MB'
+            processes = '' if row['Processes'] is None else f', {row["Processes"]}'
+            print(f'{row["Stage"]}: {status} ({row["Seconds"]:.1f} s, {memory}{processes})')
+        for problem in row['Problems']:
+            print('    ' + problem.replace('\n', '\n    '))
+        passed = passed and not row['Problems']
+
+    if all(row['Skipped'] is not None for row in report):
+        print('Every stage was skipped, nothing was checked')
+
+    return passed
@@ -0,0 +1,282 @@
+import os
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Helper_Function.Async_IO import readPickleFileAsync, QUEUE_DEPTH
+from cute_pipeline.Config import filePaths
+
+'''
+Settings
+'''
+
+# Resolution of the rendered images
+DPI = 100
+
+# Figures of every worker process, created on the first image and reused for the rest
+_figures = {}
+
+'''
+Worker Functions
+'''
+
+def _initWorker():
+    '''
+    Use a non-interactive backend in every worker process. Nothing is ever shown on screen.
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+
+def renderFit(file, title, data, fit):
+    '''
+    Render a pixel distribution trace and its double gaussian fit.
+
+    Inputs = file (string, path of the output image), title (string),
+             data (array [1 x n], median trace of a bin of columns), fit (array [1 x n], fit curve of the trace)
+    Output = file (string)
+    '''
+    import matplotlib.pyplot as plt
+
+    # Create the figure once per worker and only update the lines afterwards
+    if 'Fit' not in _figures:
+        fig, ax = plt.subplots(figsize = (8, 5))
+        data_line, = ax.plot([], [], '.', label = 'Median Trace')
+        fit_line, = ax.plot([], [], '-', label = 'Double Gaussian Fit')
+        ax.set_xlabel('Y Pixels')
+        ax.set_ylabel('Pixel Value')
+        ax.legend(loc = 'upper right')
+        _figures['Fit'] = (fig, ax, data_line, fit_line)
+
+    fig, ax, data_line, fit_line = _figures['Fit']
+    data_line.set_data(np.arange(len(data)), data)
+    fit_line.set_data(np.arange(len(fit)), fit)
+    ax.relim()
+    ax.autoscale_view()
+    ax.set_title(title)
+    fig.savefig(file, dpi = DPI)
+
+    return file
+
+def renderPanels(file, title, panels, vmin = 0, vmax = 200):
+    '''
+    Render frames one above the other, e.g. the background, fixed and final frame of a science frame.
+
+    Inputs = file (string, path of the output image), title (string),
+             panels (array, where each index is a (name, frame) pair), vmin (int), vmax (int)
+    Output = file (string)
+    '''
+    import matplotlib.pyplot as plt
+
+    # Create the figure once per worker (and number of panels) and only update the images afterwards
+    key = ('Panels', len(panels))
+    if key not in _figures:
+        # The constrained layout keeps the panel titles clear of the x labels of the panel above
+        fig, axes = plt.subplots(len(panels), 1, figsize = (12, 3 * len(panels)), squeeze = False, constrained_layout = True)
+        axes = axes[:, 0]
+        images = []
+        for ax in axes:
+            image = ax.imshow(np.zeros((1, 1)), vmin = vmin, vmax = vmax, origin = 'lower', aspect = 'auto', interpolation = None)
+            fig.colorbar(image, ax = ax)
+            ax.set_ylabel('Y Pixels')
+            images.append(image)
+        axes[-1].set_xlabel('X Pixels')
+        _figures[key] = (fig, axes, images)
+
+    fig, axes, images = _figures[key]
+    for ax, image, (name, frame) in zip(axes, images, panels):
+        image.set_data(frame)
+        image.set_clim(vmin, vmax)
+        image.set_extent((-0.5, frame.shape[1] - 0.5, -0.5, frame.shape[0] - 0.5))
+        ax.set_title(name)
+    fig.suptitle(title)
+    fig.savefig(file, dpi = DPI)
+
+    return file
+
+'''
+Task Functions
+'''
+
+def _frameIds(frame_ids, num_frames):
+    '''
+    Check the indices of the frames to render. None = every frame.
+    '''
+    if frame_ids is None:
+        return range(num_frames)
+
+    bad = [id for id in frame_ids if not 0 <= id < num_frames]
+    if bad:
+        raise ValueError(f'Frames {bad} are not in the visit, which has {num_frames} frames')
+
+    return frame_ids
+
+def medianFitTasks(config, frame_ids = None):
+    '''
+    Get the images of the median frame fits (stage 3), one per bin of columns.
+
+    Inputs = config (dict, output of loadConfig), frame_ids (not used, every frame is in the median frame)
+    Output = generator of (render function, title, data, fit) tuples
+    '''
+    from cute_pipeline.Median_Frame_Fitting import binMedians
+
+    paths = filePaths(config)
+    x = config['bin_columns']
+
+    # Read both files at the same time
+    frames_data = readPickleFileAsync(paths['Fixed Frames Pre Infill'] + '.pbz2')
+    fits_data = readPickleFileAsync(paths['Median Fits'] + '.pbz2')
+
+    # Recreate the median traces that were fitted
+    medians = binMedians(np.nanmedian(frames_data.result()['Fixed Frames'], axis = 0), x)
+
+    for i, (median, fit) in enumerate(zip(medians, fits_data.result()['Fits'])):
+        yield renderFit, f'Median Frame, Bin {i} (Columns {i * x}-{(i + 1) * x - 1})', median, fit
+
+def fixedFitTasks(config, frame_ids = None):
+    '''
+    Get the images of the fixed frame fits (stage 4), one per bin of columns of every frame.
+
+    Inputs = config (dict, output of loadConfig), frame_ids (array, indices of the frames to render. None = every frame)
+    Output = generator of (render function, title, data, fit) tuples
+    '''
+
+    paths = filePaths(config)
+    x = config['bin_columns']
+    fits = readPickleFileAsync(paths['Fixed Frames Fits'] + '.pbz2').result()['Fits']
+
+    for id in _frameIds(frame_ids, len(fits)):
+        # Frames that weren't fitted (stage 4 run with merge_partial) have nothing to show
+        if fits[id] is None:
+            continue
+        for i, (fit, params, col) in enumerate(fits[id]):
+            yield renderFit, f'Fixed Frame {id}, Bin {i} (Columns {i * x}-{(i + 1) * x - 1})', col, fit
+
+def framePanelTasks(config, frame_ids = None):
+    '''
+    Get the images of the background, fixed and final frames (stages 2 and 5), one per science frame.
+    The final frames are left out if stage 5 hasn't been run (or didn't make the final frame).
+
+    Inputs = config (dict, output of loadConfig), frame_ids (array, indices of the frames to render. None = every frame)
+    Output = generator of (render function, title, panels) tuples
+    '''
+
+    paths = filePaths(config)
+
+    # Read both files at the same time
+    frames_data = readPickleFileAsync(paths['Fixed Frames Pre Infill'] + '.pbz2')
+    final_frames = None
+    if os.path.exists(paths['Final Frames'] + '.pbz2'):
+        final_frames = readPickleFileAsync(paths['Final Frames'] + '.pbz2').result()
+    frames_data = frames_data.result()
+
+    for id in _frameIds(frame_ids, len(frames_data['Fixed Frames'])):
+        panels = [('Background Frame', frames_data['Background Frames'][id]), ('Fixed Frame', frames_data['Fixed Frames'][id])]
+        if final_frames is not None and final_frames[id] is not None:
+            panels.append(('Final Frame', final_frames[id]))
+        yield renderPanels, f'Frame {id}', panels
+
+# Task function of every kind of rendering
+RENDERS = {
+    'median-fits': medianFitTasks,
+    'fixed-fits': fixedFitTasks,
+    'frames': framePanelTasks,
+}
+
+'''
+Batch Functions
+'''
+
+def renderImages(tasks, output_dir, workers = None, depth = QUEUE_DEPTH):
+    '''
+    Render images in a pool of processes.
+
+    Inputs = tasks (iterable, where each index is a (render function, title, *data) tuple e.g. the output of medianFitTasks),
+             output_dir (string, folder of the images), workers (int, number of processes. None = one per CPU),
+             depth (int, maximum number of images waiting to be rendered)
+    Output = files (array, paths of the images in the same order as the tasks)
+
+    The tasks are handed to the workers as they are generated, so only 'depth' images worth of
+    data are held in memory at once.
+    '''
+
+    # Remove the images of an earlier run so they don't end up in the animation
+    os.makedirs(output_dir, exist_ok = True)
+    for file in os.listdir(output_dir):
+        if file.endswith('.png'):
+            os.remove(os.path.join(output_dir, file))
+
+    files = []
+    pending = deque()
+
+    with ProcessPoolExecutor(max_workers = workers, initializer = _initWorker) as pool:
+        for i, (render, title, *data) in enumerate(tasks):
+            file = os.path.join(output_dir, f'{i:05d}.png')
+            pending.append(pool.submit(render, file, title, *data))
+
+            # Wait for the oldest image once the queue is full
+            if len(pending) >= depth:
+                files.append(pending.popleft().result())
+
+        while pending:
+            files.append(pending.popleft().result())
+
+    return files
+
+def createAnimation(files, output_file, fps = 5):
+    '''
+    Join rendered images into an animation.
+
+    Inputs = files (array, paths of the images in order, output of renderImages),
+             output_file (string, path of the animation. A .gif is made with Pillow, a .mp4 with ffmpeg),
+             fps (int, frames per second)
+    '''
+
+    if output_file.endswith('.gif'):
+        from PIL import Image
+
+        def loadImages(files):
+            # Read one image at a time and close its file right away. A whole visit has thousands of
+            # images, far more than the number of files that can be open at once.
+            for file in files:
+                with Image.open(file) as image:
+                    yield image.convert('RGB')
+
+        images = loadImages(files)
+        next(images).save(output_file, save_all = True, append_images = images, duration = 1000 / fps, loop = 0)
+
+    elif output_file.endswith('.mp4'):
+        if shutil.which('ffmpeg') is None:
+            raise RuntimeError('ffmpeg is needed to create .mp4 animations')
+
+        # renderImages numbers the images in order. The padding makes the size even, which the h264 codec needs
+        pattern = os.path.join(os.path.dirname(files[0]), '%05d.png')
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(fps), '-i', pattern,
+                        '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', output_file], check = True)
+
+    else:
+        raise ValueError(f'Unknown animation format: {output_file}')
+
+    return
+
+def render(kind, config, output_dir = 'Images/Render', frame_ids = None, animation = 'gif', fps = 5, workers = None):
+    '''
+    Render the diagnostic images of a visit and join them into an animation.
+
+    Inputs = kind (string, key of RENDERS), config (dict, output of loadConfig),
+             output_dir (string, the images go in output_dir/kind and the animation in output_dir/kind.gif or .mp4),
+             frame_ids (array, frames to render for 'fixed-fits' and 'frames'. None = every frame),
+             animation (string, 'gif', 'mp4' or None = only the images), fps (int), workers (int, number of processes)
+    Output = files (array, paths of the images)
+    '''
+
+    # Check for ffmpeg before spending time on the images
+    if animation == 'mp4' and shutil.which('ffmpeg') is None:
+        raise RuntimeError('ffmpeg is needed to create .mp4 animations')
+
+    files = renderImages(RENDERS[kind](config, frame_ids), os.path.join(output_dir, kind), workers)
+
+    if animation is not None and files:
+        createAnimation(files, os.path.join(output_dir, f'{kind}.{animation}'), fps)
+
+    return files
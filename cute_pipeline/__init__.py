@@ -0,0 +1,15 @@
+'''
+CUTE CubeSat Proxy Pixel Pipeline.
+
+Every stage of the pipeline lives in its own module and exposes a run(config) function as well as
+the functions it is built from, so they can be reused/benchmarked without running a whole stage:
+
+    cute_pipeline.Proxy_Matches         (stage1, 1_Proxy_Matches.py)
+    cute_pipeline.Frame_Creations       (stage2, 2_Frame_Creations.py)
+    cute_pipeline.Median_Frame_Fitting  (stage3, 3_Median_Frame_Fitting.py)
+    cute_pipeline.Fixed_Frame_Fitting   (stage4, 4_Fixed_Frame_Fitting.py)
+    cute_pipeline.Create_Final_Frames   (stage5, 5_Create_Final_Frames.py)
+
+Importing the package doesn't import any of them, and scipy/lacosmic/matplotlib are only
+imported by the functions that use them.
+'''
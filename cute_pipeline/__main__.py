@@ -0,0 +1,3 @@
+from cute_pipeline.CLI import main
+
+main()
@@ -0,0 +1,95 @@
+import bz2
+import glob
+import os
+import pickle as pkl
+import numpy as np
+import pytest
+from Helper_Function import Async_IO
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'Results')
+
+def _sameData(a, b):
+    '''
+    Two unpickled objects are the same if they pickle to the same bytes.
+    '''
+    return pkl.dumps(a) == pkl.dumps(b)
+
+@pytest.fixture
+def multi_stream_file(tmp_path):
+    '''
+    Write a payload that is bigger than a single STREAM_SIZE chunk.
+    '''
+    rng = np.random.default_rng(0)
+    data = {'Info': 'Async_IO test payload',
+            'Frames': [rng.normal(size = (100, 2048)) for _ in range(5)]} # ~8 MB = 3 chunks
+    file = str(tmp_path / 'payload.pbz2')
+    Async_IO.writeCompressedPickle(data, file, workers = 4)
+
+    return data, file
+
+def test_round_trip_multi_stream(multi_stream_file):
+    data, file = multi_stream_file
+
+    with open(file, 'rb') as f:
+        offsets = Async_IO._streamOffsets(f.read())
+    assert offsets[0] == 0 and len(offsets) > 1
+    assert not os.path.exists(file + '.tmp')
+
+    assert _sameData(Async_IO.readCompressedPickle(file, workers = 4), data)
+    assert _sameData(Async_IO.readCompressedPickle(file, workers = 1), data)
+
+def test_multi_stream_readable_by_bz2(multi_stream_file):
+    data, file = multi_stream_file
+
+    with bz2.open(file, 'rb') as f:
+        assert _sameData(pkl.load(f), data)
+
+def test_split_error_fallback(multi_stream_file, monkeypatch):
+    data, file = multi_stream_file
+
+    # Pretend the stream marker showed up in the middle of the first stream
+    offsets = Async_IO._streamOffsets
+    monkeypatch.setattr(Async_IO, '_streamOffsets', lambda raw: sorted(offsets(raw) + [offsets(raw)[1] // 2]))
+
+    with open(file, 'rb') as f:
+        raw = f.read()
+    with pytest.raises(Async_IO._SplitError):
+        Async_IO._decompressStream(raw[:offsets(raw)[1] // 2])
+
+    assert _sameData(Async_IO.readCompressedPickle(file, workers = 4), data)
+
+def test_reads_single_stream_results():
+    files = glob.glob(os.path.join(RESULTS_DIR, '*.pbz2'))
+    if not files:
+        pytest.skip('no archives in Results')
+
+    # The smallest archive keeps the test quick
+    file = min(files, key = os.path.getsize)
+    with bz2.open(file, 'rb') as f:
+        expected = pkl.load(f)
+
+    assert _sameData(Async_IO.readCompressedPickle(file, workers = 4), expected)
+
+def test_prefetch_keeps_order():
+    assert list(Async_IO.prefetch(lambda i: i * i, range(50), depth = 4, workers = 3)) == [i * i for i in range(50)]
+
+def test_convert_single_stream(multi_stream_file, tmp_path):
+    data, _ = multi_stream_file
+
+    # Write the payload the way the legacy data files were written
+    legacy_file = str(tmp_path / 'legacy.pbz2')
+    with bz2.BZ2File(legacy_file, 'wb') as f:
+        pkl.dump(data, f)
+    with open(legacy_file, 'rb') as f:
+        legacy = f.read()
+    assert not Async_IO._isMultiStream(legacy)
+
+    assert Async_IO.convertCompressedPickle(legacy_file, workers = 4)
+    with open(legacy_file, 'rb') as f:
+        converted = f.read()
+    assert Async_IO._isMultiStream(converted)
+    assert bz2.decompress(converted) == bz2.decompress(legacy)
+    assert _sameData(Async_IO.readCompressedPickle(legacy_file, workers = 4), data)
+
+    # A second conversion leaves the file alone
+    assert not Async_IO.convertCompressedPickle(legacy_file)
@@ -0,0 +1,60 @@
+import pytest
+from cute_pipeline import CLI
+from cute_pipeline.Config import DEFAULTS
+from cute_pipeline.Parallel import SerialComm
+
+def _overrides(argv):
+    '''
+    Settings that a command line overrides, the same way as main.
+    '''
+    args = CLI.buildParser().parse_args(argv)
+    return {key: val for key, val in vars(args).items() if key in DEFAULTS}
+
+def test_switches_have_a_negative_form():
+    assert _overrides(['run', 'stage1'])['approximate'] is None
+    assert _overrides(['run', 'stage1', '--approximate'])['approximate'] is True
+
+    overrides = _overrides(['run', 'stage1', '--no-approximate', '--no-resume', '--no-fresh-start', '--no-merge-partial'])
+    assert [overrides[key] for key in ('approximate', 'resume', 'fresh_start', 'merge_partial')] == [False] * 4
+
+class _WorkerComm(SerialComm):
+    '''
+    Second process of a 2 process MPI run, gets the broadcasts of the root process from a list.
+    '''
+
+    def __init__(self, broadcasts):
+        self.broadcasts = list(broadcasts)
+
+    def Get_rank(self):
+        return 1
+
+    def Get_size(self):
+        return 2
+
+    def bcast(self, data, root = 0):
+        return self.broadcasts.pop(0)
+
+    def Barrier(self):
+        raise AssertionError('waiting at the barrier after the root process failed')
+
+def test_root_stage_failure_stops_other_processes(monkeypatch):
+    comm = _WorkerComm([dict(DEFAULTS), 'stage3 failed on the root process'])
+    monkeypatch.setattr(CLI, 'getComm', lambda parallel = True: comm)
+
+    with pytest.raises(RuntimeError, match = 'stage3 failed'):
+        CLI.runStages(['stage3'])
+
+def test_root_stage_failure_is_raised(tmp_path, monkeypatch):
+    broadcasts = []
+
+    class RootComm(SerialComm):
+        def bcast(self, data, root = 0):
+            broadcasts.append(data)
+            return data
+
+    monkeypatch.setattr(CLI, 'getComm', lambda parallel = True: RootComm())
+
+    # Stage 3 can't find the output of stage 2
+    with pytest.raises(FileNotFoundError):
+        CLI.runStages(['stage3'], overrides = {'results_dir': str(tmp_path)})
+    assert broadcasts[-1] == 'stage3 failed on the root process'
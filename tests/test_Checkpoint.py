@@ -0,0 +1,63 @@
+import os
+import pytest
+from Helper_Function.Async_IO import writeCompressedPickle
+from Helper_Function.Checkpoint import Checkpointer, checkpointFile, checkpointFiles, loadCheckpoints, startCheckpoints
+
+NAME = 'WASP189b_Median_Method_Proxy_Matches'
+
+def _save(directory, part, results, name = NAME):
+    '''
+    Write a checkpoint file the same way a stage does.
+    '''
+    with Checkpointer(checkpointFile(name, part, str(directory)), results):
+        pass
+
+def test_start_refuses_existing_checkpoints(tmp_path):
+    _save(tmp_path, 'rank0_of_1', {1: 'a'})
+
+    with pytest.raises(RuntimeError, match = '--resume'):
+        startCheckpoints(NAME, str(tmp_path))
+
+    # Nothing was deleted
+    assert len(checkpointFiles(NAME, str(tmp_path))) == 1
+
+def test_start_resume_and_fresh_start(tmp_path):
+    assert startCheckpoints(NAME, str(tmp_path)) == {}
+
+    _save(tmp_path, 'rank0_of_1', {1: 'a'})
+    assert startCheckpoints(NAME, str(tmp_path), resume = True) == {1: 'a'}
+
+    assert startCheckpoints(NAME, str(tmp_path), fresh_start = True) == {}
+    assert checkpointFiles(NAME, str(tmp_path)) == []
+
+def test_load_merges_different_rank_counts(tmp_path):
+    # A run on 2 processes was killed, then resumed on 3 processes and killed again
+    _save(tmp_path, 'rank0_of_2', {1: 'a', 2: 'b'})
+    _save(tmp_path, 'rank1_of_2', {5: 'e'})
+    _save(tmp_path, 'rank0_of_3', {1: 'a', 2: 'b', 3: 'c'})
+    _save(tmp_path, 'rank2_of_3', {5: 'e', 6: 'f'})
+
+    # Checkpoints of other outputs are left out
+    _save(tmp_path, 'rank0_of_1', {9: 'i'}, name = NAME + '_Approximate')
+
+    assert loadCheckpoints(NAME, str(tmp_path)) == {1: 'a', 2: 'b', 3: 'c', 5: 'e', 6: 'f'}
+
+def test_unfinished_writes_are_ignored(tmp_path):
+    _save(tmp_path, 'rank0_of_1', {1: 'a'})
+
+    # A process killed while writing its checkpoint leaves a .tmp file behind
+    writeCompressedPickle({2: 'b'}, checkpointFile(NAME, 'rank1_of_2', str(tmp_path)) + '.pbz2')
+    os.rename(checkpointFile(NAME, 'rank1_of_2', str(tmp_path)) + '.pbz2', checkpointFile(NAME, 'rank1_of_2', str(tmp_path)) + '.pbz2.tmp')
+
+    assert checkpointFiles(NAME, str(tmp_path)) == [checkpointFile(NAME, 'rank0_of_1', str(tmp_path)) + '.pbz2']
+    assert loadCheckpoints(NAME, str(tmp_path)) == {1: 'a'}
+
+def test_checkpointer_saves_on_error(tmp_path):
+    results = {}
+    with pytest.raises(ValueError):
+        with Checkpointer(checkpointFile(NAME, 'rank0_of_1', str(tmp_path)), results, interval = 600) as checkpointer:
+            results[1] = 'a'
+            checkpointer.update()
+            raise ValueError('the stage failed')
+
+    assert loadCheckpoints(NAME, str(tmp_path)) == {1: 'a'}
@@ -0,0 +1,25 @@
+import json
+import pytest
+from cute_pipeline.Config import DEFAULTS, loadConfig
+
+def _configFile(tmp_path, settings):
+    file = tmp_path / 'config.json'
+    file.write_text(json.dumps(settings))
+    return str(file)
+
+def test_defaults():
+    assert loadConfig() == DEFAULTS
+
+def test_unknown_settings_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match = 'colum_window'):
+        loadConfig(_configFile(tmp_path, {'visit': 3, 'colum_window': 20}))
+
+def test_overrides_take_priority(tmp_path):
+    file = _configFile(tmp_path, {'visit': 3, 'approximate': True, 'column_window': 20})
+    config = loadConfig(file, {'visit': 7, 'approximate': False, 'column_window': None})
+
+    assert config['visit'] == 7
+    assert config['approximate'] is False
+    # None = the option wasn't given, the config file is kept
+    assert config['column_window'] == 20
+    assert config['target'] == DEFAULTS['target']
@@ -0,0 +1,37 @@
+import numpy as np
+from Helper_Function.Helper import buildColumnIndex, nearbyPixels, decoder
+
+X_LENGTH = 100
+
+def _tags(positions):
+    '''
+    Encode (x, y) positions as pixel tags.
+    '''
+    return [y * X_LENGTH + x for x, y in positions]
+
+def test_column_window_is_inclusive():
+    tags = _tags([(10, 0), (11, 0), (14, 0), (15, 0), (16, 0), (19, 0), (20, 0), (21, 0)])
+    index = buildColumnIndex(tags, X_LENGTH)
+
+    # Columns 11 to 19 are within 4 columns of column 15, both ends included
+    idxs = nearbyPixels(index, 15, 0, 4)
+    assert sorted(decoder(tags[i], X_LENGTH)[0] for i in idxs) == [11, 14, 15, 16, 19]
+
+def test_row_radius_filters_rows():
+    tags = _tags([(5, 0), (5, 7), (5, 10), (6, 13), (6, 14), (40, 10)])
+    index = buildColumnIndex(tags, X_LENGTH)
+
+    assert list(nearbyPixels(index, 5, 10, 2)) == [0, 1, 2, 3, 4]
+    assert list(nearbyPixels(index, 5, 10, 2, row_radius = 3)) == [1, 2, 3]
+    assert list(nearbyPixels(index, 5, 10, 2, row_radius = 0)) == [2]
+
+def test_indices_keep_tag_order():
+    # Tags in an order that is neither sorted by column nor by row
+    rng = np.random.default_rng(0)
+    positions = [(int(x), int(y)) for x, y in zip(rng.integers(0, X_LENGTH, 200), rng.integers(0, 50, 200))]
+    tags = _tags(positions)
+    index = buildColumnIndex(tags, X_LENGTH)
+
+    idxs = nearbyPixels(index, 50, 25, 10, row_radius = 5)
+    expected = [i for i, (x, y) in enumerate(positions) if abs(x - 50) <= 10 and abs(y - 25) <= 5]
+    assert list(idxs) == expected
@@ -0,0 +1,162 @@
+import csv
+import json
+import os
+import numpy as np
+import pytest
+from Helper_Function.Helper import readPickleFile, outputPickleFile, getTags
+from cute_pipeline import Regression
+from cute_pipeline.Config import loadConfig, filePaths
+
+X_LENGTH = 100
+BIN_COLUMNS = 10
+
+@pytest.fixture
+def config(tmp_path):
+    return loadConfig(overrides = {'data_dir': str(tmp_path / 'data'), 'results_dir': str(tmp_path / 'results'),
+                                   'x_length': X_LENGTH, 'bin_columns': BIN_COLUMNS})
+
+def _match(x, y, nspec_tag):
+    return {'Combo': (y * X_LENGTH + x, nspec_tag), 'Median': 0.0, 'STD': 1.0}
+
+def _fixedFits(num_frames, bins, fit = 1.0, col = 1.0):
+    return {'Info': 'test', 'Fits': [[(np.full(5, fit), np.full(8, fit), np.full(5, col)) for _ in range(bins)] for _ in range(num_frames)]}
+
+'''
+Restriction Tests
+'''
+
+def test_restrict_proxy_matches(config):
+    data = [[_match(5, 0, 1), _match(30, 0, 2)], [_match(29, 3, 3), _match(31, 3, 4)]]
+
+    restricted = Regression.restrictProxyMatches(data, 30, config)
+    assert [[match['Combo'][1] for match in node] for node in restricted] == [[1], [3]]
+
+    # The approximate search output keeps its other keys
+    restricted = Regression.restrictProxyMatches({'Matches': data, 'Validated': 4, 'Mismatches': 1}, 30, config)
+    assert restricted['Validated'] == 4 and len(restricted['Matches'][0]) == 1
+
+def test_restrict_frames_and_fits(config):
+    frames = {'Info': 'test', 'Fixed Frames': [np.ones((4, X_LENGTH))] * 2, 'Background Frames': [np.ones((4, X_LENGTH))] * 2}
+    restricted = Regression.restrictFrames(frames, 30, config)
+    assert [frame.shape for frame in restricted['Fixed Frames'] + restricted['Background Frames']] == [(4, 30)] * 4
+    assert restricted['Info'] == 'test'
+
+    median_fits = {'Fits': list(range(10)), 'Params': list(range(10))}
+    assert Regression.restrictMedianFits(median_fits, 30, config) == {'Fits': [0, 1, 2], 'Params': [0, 1, 2]}
+
+    # Frames that weren't fitted stay None
+    fixed_fits = _fixedFits(2, 10)
+    fixed_fits['Fits'][1] = None
+    restricted = Regression.restrictFixedFits(fixed_fits, 30, config)
+    assert len(restricted['Fits'][0]) == 3 and restricted['Fits'][1] is None
+
+    final_frames = (np.ones((4, X_LENGTH)), None)
+    restricted = Regression.restrictFinalFrames(final_frames, 30, config)
+    assert restricted[0].shape == (4, 30) and restricted[1] is None
+
+'''
+Comparison Tests
+'''
+
+def test_compare_proxy_matches():
+    golden = [[_match(1, 0, 1), _match(2, 0, 2)], [_match(3, 0, 3)]]
+
+    # Same pairs found by a different number of nodes
+    assert Regression.compareProxyMatches([[_match(1, 0, 1)], [_match(2, 0, 2), _match(3, 0, 3)]], golden, Regression.TOLERANCES) == []
+
+    changed = [[_match(1, 0, 1), _match(2, 0, 7)], [_match(3, 0, 3)]]
+    assert Regression.compareProxyMatches(changed, golden, Regression.TOLERANCES) == ['1 of 3 proxy pairs are different']
+
+    assert Regression.compareProxyMatches([[_match(1, 0, 1)]], golden, Regression.TOLERANCES) == ['1 proxy pairs instead of 3']
+
+def test_compare_frames():
+    golden = {'Fixed Frames': [np.ones((4, 10))] * 3, 'Background Frames': [np.zeros((4, 10))] * 3}
+    output = {'Fixed Frames': [np.ones((4, 10)), np.ones((4, 10)) + 1e-9, np.ones((4, 10))],
+              'Background Frames': [np.zeros((4, 10))] * 3}
+    assert Regression.compareFrames(output, golden, Regression.TOLERANCES) == []
+
+    output['Fixed Frames'][1] = np.ones((4, 10)) + 1e-3
+    assert Regression.compareFrames(output, golden, Regression.TOLERANCES) == ['1 of 3 Fixed Frames are different']
+
+def test_compare_fixed_fits():
+    golden = _fixedFits(2, 3)
+    # The fits get the looser tolerance of the random search, the filtered medians don't
+    assert Regression.compareFixedFits(_fixedFits(2, 3, fit = 1.0001), golden, Regression.TOLERANCES) == []
+    assert Regression.compareFixedFits(_fixedFits(2, 3, col = 1.0001), golden, Regression.TOLERANCES) == ['6 of 6 filtered bin medians are different']
+
+    output = _fixedFits(2, 3)
+    output['Fits'][1][2] = (np.full(5, 1.5), np.full(8, 1.0), np.full(5, 1.0))
+    assert Regression.compareFixedFits(output, golden, Regression.TOLERANCES) == ['1 of 6 bin fits are different']
+
+'''
+Fixture Tests
+'''
+
+def _writeData(config):
+    '''
+    Write the input files of stage 1 with 3 spectral pixels, two of them in the first 20 columns.
+    '''
+    paths = filePaths(config)
+    os.makedirs(config['data_dir'])
+
+    spec_tags = [5, 1 * X_LENGTH + 25, 2 * X_LENGTH + 19]
+    for key, tags in (('Spectral Tags', spec_tags), ('Non-Spectral Tags', [50, 60]), ('Excluded Tags', [60])):
+        with open(paths[key], mode='w', newline='') as f:
+            csv.writer(f).writerows([[tag] for tag in tags])
+
+    spec_vals = np.arange(3 * 4).reshape(3, 4).astype(float)
+    outputPickleFile({'Spectral Pixels in Dark Frames': spec_vals, 'Non-Spectral Pixels in Dark Frames': np.zeros((2, 4))},
+                     paths['Dark Pixel Values'][:-len('.pbz2')])
+    for key in ('Science Frames', 'Visit Pixel Values'):
+        outputPickleFile({'Info': key}, paths[key][:-len('.pbz2')])
+
+    return spec_vals
+
+def test_make_fixture(config, tmp_path):
+    spec_vals = _writeData(config)
+    fixture_dir = str(tmp_path / 'fixture')
+
+    with pytest.raises(ValueError):
+        Regression.makeFixture(config, fixture_dir, 25)
+
+    Regression.makeFixture(config, fixture_dir, 20)
+    fixture_config = dict(config, data_dir = fixture_dir)
+    fixture_paths = filePaths(fixture_config)
+
+    assert Regression.fixtureColumns(config) is None
+    assert Regression.fixtureColumns(fixture_config) == 20
+    assert getTags(fixture_paths['Spectral Tags']) == [5, 2 * X_LENGTH + 19]
+    assert getTags(fixture_paths['Non-Spectral Tags']) == [50, 60]
+
+    pix_data = readPickleFile(fixture_paths['Dark Pixel Values'])
+    assert np.array_equal(pix_data['Spectral Pixels in Dark Frames'], spec_vals[[0, 2]])
+    assert readPickleFile(fixture_paths['Science Frames']) == {'Info': 'Science Frames'}
+
+'''
+Golden File Tests
+'''
+
+def test_bless_full_data_needs_golden_dir(config):
+    with pytest.raises(ValueError, match = 'golden folder'):
+        Regression.runRegression(['stage1'], config, bless = True)
+
+def test_random_stages_need_a_seed(config, tmp_path):
+    # A fixture with golden files in a folder that doesn't record their seed, like Results
+    _writeData(config)
+    fixture_dir = str(tmp_path / 'fixture')
+    Regression.makeFixture(config, fixture_dir, 20)
+    golden_dir = tmp_path / 'golden'
+    golden_dir.mkdir()
+    golden_paths = filePaths(dict(config, results_dir = str(golden_dir)))
+    outputPickleFile({'Fixed Frames': [np.ones((4, X_LENGTH))], 'Background Frames': [np.ones((4, X_LENGTH))]}, golden_paths['Fixed Frames Pre Infill'])
+    outputPickleFile({'Fits': [], 'Params': []}, golden_paths['Median Fits'])
+
+    fixture_config = dict(config, data_dir = fixture_dir, seed = 1)
+    report = Regression.runRegression(['stage3'], fixture_config, str(golden_dir))
+    assert 'was not blessed with a seed' in report[0]['Skipped']
+
+    # Golden files blessed with another seed
+    with open(golden_dir / Regression.GOLDEN_INFO_FILE, mode='w') as f:
+        json.dump({'stage3': {'seed': 2, 'frames': None, 'columns': 20}}, f)
+    report = Regression.runRegression(['stage3'], fixture_config, str(golden_dir))
+    assert 'run with --seed 2' in report[0]['Skipped']
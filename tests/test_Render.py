@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('matplotlib')
+pytest.importorskip('PIL')
+
+from PIL import Image
+from cute_pipeline import Render
+
+def test_render_fits_and_gif(tmp_path):
+    x = np.arange(50)
+    tasks = [(Render.renderFit, f'Bin {i}', np.exp(-(x - 25) ** 2 / 50) + i, np.exp(-(x - 25) ** 2 / 50) + i) for i in range(2)]
+
+    files = Render.renderImages(tasks, str(tmp_path / 'images'), workers = 1)
+    assert [file[-9:] for file in files] == ['00000.png', '00001.png']
+
+    animation = str(tmp_path / 'fits.gif')
+    Render.createAnimation(files, animation)
+    with Image.open(animation) as image:
+        assert image.n_frames == 2
+
+def test_panels_follow_color_limits(tmp_path):
+    Render._initWorker()
+    panels = [('Fixed Frame', np.ones((5, 20))), ('Final Frame', np.zeros((5, 20)))]
+
+    # The figure is reused, the color limits of every call must still apply
+    Render.renderPanels(str(tmp_path / 'a.png'), 'Frame 0', panels)
+    Render.renderPanels(str(tmp_path / 'b.png'), 'Frame 1', panels, vmin = -5, vmax = 5)
+
+    _, _, images = Render._figures[('Panels', 2)]
+    assert [image.get_clim() for image in images] == [(-5, 5)] * 2